@@ -0,0 +1,267 @@
+"""
+    Benchmarks each phase of dungeon generation separately:
+     - partition: growing the BSP tree (TreeNode or FlatTree)
+     - rooms: generateTreeRooms / generateRoom
+     - bridges: generateTreeBridges / findClosestRoom
+     - raster: rasterizeDungeon
+    over a grid of dungeon sizes and minimum node sizes with fixed seeds.
+    Results are printed as a table and can be written as JSON with --output,
+     and compared against an earlier JSON run with --compare.
+    Every round also times a fixed pure Python workload, and --compare
+     divides out the change in its speed, so a machine that is slower as a
+     whole (throttling, busy neighbours) isn't reported as a regression.
+"""
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import pybsp
+
+PHASES = ("partition", "rooms", "bridges", "raster")
+# Settings that must match for two runs to be compared:
+CONFIG_KEYS = ("treeEngine", "rasterOutput", "runs", "repeats")
+
+def benchmarkCases (cases, seeds, **kwargs):
+    """
+        Generates one dungeon per seed for every (dungeonSize, minNodeSize)
+         case, timing every phase repeats times (3 by default).
+        Repeats run in rounds over all cases, so a burst of noise on the machine
+         slows one repeat of several cases instead of every repeat of one.
+        Returns a dict per case: "best" is the mean over seeds of each seed's
+         fastest repeat (the figure --compare uses), "mean" the mean of every
+         timing. Also gives the throughput of the whole generation and its
+         peak traced memory.
+    """
+    treeEngine = kwargs["treeEngine"] if "treeEngine" in kwargs else "recursive"
+    output = kwargs["output"] if "output" in kwargs else "list"
+    repeats = kwargs["repeats"] if "repeats" in kwargs else 3
+    calibration = kwargs["calibration"] if "calibration" in kwargs else None
+    # timings[case][seed] is the list of {phase: seconds} of each repeat:
+    timings = [[[] for seed in seeds] for case in cases]
+    roomCounts = [[0] * len(seeds) for case in cases]
+    for repeat in range(repeats):
+        if calibration != None:
+            calibration.append(calibrate())
+        for caseIndex, (dungeonSize, minNodeSize) in enumerate(cases):
+            for seedIndex, seed in enumerate(seeds):
+                seconds, roomCount = _timePhases(dungeonSize, minNodeSize, seed,
+                                                 treeEngine, output)
+                timings[caseIndex][seedIndex].append(seconds)
+                roomCounts[caseIndex][seedIndex] = roomCount
+    return [_summarizeCase(dungeonSize, minNodeSize, seeds, timings[caseIndex],
+                           roomCounts[caseIndex], treeEngine, output)
+            for caseIndex, (dungeonSize, minNodeSize) in enumerate(cases)]
+
+def calibrate ():
+    """
+        Returns the seconds a fixed pure Python workload takes (best of 3),
+         a measure of how fast the machine is right now.
+    """
+    bestSeconds = None
+    for attempt in range(3):
+        startTime = time.perf_counter()
+        # Allocation, slicing, sorting and dict work, like generation does:
+        rng = random.Random(0)
+        rects = [(rng.randrange(500), rng.randrange(500), rng.randrange(50))
+                 for rect in range(20000)]
+        rects.sort()
+        grid = [[0] * 500 for row in range(500)]
+        for x, y, width in rects:
+            grid[y][x:x + width] = [1] * width
+        counts = {}
+        for x, y, width in rects:
+            counts[(x // 10, y // 10)] = counts.get((x // 10, y // 10), 0) + 1
+        seconds = time.perf_counter() - startTime
+        bestSeconds = seconds if bestSeconds == None else min(bestSeconds,
+                                                              seconds)
+    return bestSeconds
+
+def benchmarkCase (dungeonSize, minNodeSize, seeds, **kwargs):
+    """
+        Benchmarks a single case, see benchmarkCases.
+    """
+    return benchmarkCases([(dungeonSize, minNodeSize)], seeds, **kwargs)[0]
+
+def _summarizeCase (dungeonSize, minNodeSize, seeds, seedTimings, roomCounts,
+                    treeEngine, output):
+    # Measure memory in a separate run, tracing slows everything down:
+    tracemalloc.start()
+    _timePhases(dungeonSize, minNodeSize, seeds[0], treeEngine, output)
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    for repeatTimings in seedTimings:
+        for seconds in repeatTimings:
+            seconds["total"] = sum(seconds[phase] for phase in PHASES)
+    summary = {}
+    for phase in PHASES + ("total",):
+        allSeconds = [seconds[phase] for repeatTimings in seedTimings
+                      for seconds in repeatTimings]
+        summary[phase] = {"best": sum(min(seconds[phase]
+                                          for seconds in repeatTimings)
+                                      for repeatTimings in seedTimings) /
+                                  len(seeds),
+                          "mean": sum(allSeconds) / len(allSeconds)}
+    meanTotal = summary["total"]["mean"]
+    for phase in PHASES:
+        summary[phase]["share"] = (summary[phase]["mean"] / meanTotal
+                                   if meanTotal else 0)
+
+    tiles = dungeonSize[0] * dungeonSize[1]
+    return {"dungeonSize": list(dungeonSize), "minNodeSize": list(minNodeSize),
+            "runs": len(seeds), "rooms": sum(roomCounts) / len(roomCounts),
+            "phases": dict((phase, summary[phase]) for phase in PHASES),
+            "total": summary["total"],
+            "dungeonsPerSecond": 1 / meanTotal if meanTotal else 0,
+            "tilesPerSecond": tiles / meanTotal if meanTotal else 0,
+            "peakMemoryBytes": peakMemory}
+
+def _timePhases (dungeonSize, minNodeSize, seed, treeEngine, output):
+    """
+        Runs the generateDungeon2DList pipeline step by step with one seed.
+        Returns ({phase: seconds}, roomCount).
+    """
+    rng = random.Random(seed)
+    seconds = {}
+    startTime = time.perf_counter()
+    if treeEngine == "flat":
+        dungeonTree = pybsp.FlatTree((0, 0), dungeonSize, minNodeSize, rng)
+    else:
+        dungeonTree = pybsp.TreeNode((0, 0), dungeonSize, minNodeSize, rng=rng)
+    seconds["partition"] = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    dungeonTree.generateTreeRooms(0.75, 0, rng)
+    roomsList = dungeonTree.getRoomsList()
+    seconds["rooms"] = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    bridgesList = pybsp.generateTreeBridges(roomsList, 1, rng)
+    seconds["bridges"] = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    pybsp.rasterizeDungeon(dungeonSize, roomsList, bridgesList, output)
+    seconds["raster"] = time.perf_counter() - startTime
+    return seconds, len(roomsList)
+
+def compareResults (baseline, current, threshold, minSeconds=0.001):
+    """
+        Prints the slowdown of every phase against a baseline run.
+        Returns the list of (case, phase, ratio) over threshold. Phases that
+         took under minSeconds in the baseline are too noisy to count.
+        Ratios are divided by the change in calibration time between the
+         runs, when both have one.
+        Raises ValueError if the runs were made with different settings.
+    """
+    for key in CONFIG_KEYS:
+        if baseline.get(key) != current.get(key):
+            raise ValueError("Can't compare runs with different %s: %r and %r"
+                             % (key, baseline.get(key), current.get(key)))
+    machineRatio = 1
+    if baseline.get("calibrationSeconds") and current.get("calibrationSeconds"):
+        machineRatio = (current["calibrationSeconds"] /
+                        baseline["calibrationSeconds"])
+        print("Machine speed x%.2f, divided out of every ratio" %
+              (1 / machineRatio))
+    baselineCases = dict(((tuple(case["dungeonSize"]),
+                           tuple(case["minNodeSize"])), case)
+                         for case in baseline["results"])
+    regressions = []
+    for case in current["results"]:
+        key = (tuple(case["dungeonSize"]), tuple(case["minNodeSize"]))
+        if key not in baselineCases:
+            continue
+        ratios = []
+        for phase in PHASES + ("total",):
+            old = (baselineCases[key]["phases"][phase]["best"]
+                   if phase != "total" else baselineCases[key]["total"]["best"])
+            new = (case["phases"][phase]["best"]
+                   if phase != "total" else case["total"]["best"])
+            ratio = new / old / machineRatio if old else 1
+            ratios.append("%s x%.2f" % (phase, ratio))
+            if ratio > threshold and old >= minSeconds:
+                regressions.append((key, phase, ratio))
+        print("%-20s %s" % (_caseName(key), "  ".join(ratios)))
+    return regressions
+
+def _caseName (key):
+    dungeonSize, minNodeSize = key
+    return "%s/%s" % ("x".join(map(str, dungeonSize)),
+                      "x".join(map(str, minNodeSize)))
+
+def _printCase (case):
+    shares = "  ".join("%s %5.1f%%" % (phase, case["phases"][phase]["share"]
+                                        * 100) for phase in PHASES)
+    print("%-12s %-8s rooms %7.0f  %8.2f dungeons/s %12.0f tiles/s  "
+          "peak %8.1f KiB  %s" %
+          ("x".join(map(str, case["dungeonSize"])),
+           "x".join(map(str, case["minNodeSize"])), case["rooms"],
+           case["dungeonsPerSecond"], case["tilesPerSecond"],
+           case["peakMemoryBytes"] / 1024, shares))
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark dungeon generation phases')
+    parser.add_argument('--sizes', default=[100, 250, 500, 1000], nargs='+', type=int,
+                        help='Square dungeon sizes to benchmark.')
+    parser.add_argument('--minNodeSizes', default=[10, 20, 40], nargs='+', type=int,
+                        help='Square minimum node sizes to benchmark.')
+    parser.add_argument('--runs', default=5, type=int,
+                        help='Number of seeds (0 to runs-1) to time per case.')
+    parser.add_argument('--repeats', default=3, type=int,
+                        help='Times each seed is timed; its fastest repeat counts.')
+    parser.add_argument('--treeEngine', default="recursive", choices=["recursive", "flat"],
+                        help='Tree engine to benchmark.')
+    parser.add_argument('--rasterOutput', default="list", choices=["list", "numpy", "packed"],
+                        help='rasterizeDungeon output form to benchmark.')
+    parser.add_argument('--output', default=None,
+                        help='Write the results as JSON to this file.')
+    parser.add_argument('--compare', default=None,
+                        help='Compare against the JSON results of an earlier run.')
+    parser.add_argument('--minSeconds', default=0.001, type=float,
+                        help='Phases faster than this in the baseline never count as regressions.')
+    parser.add_argument('--threshold', default=1.25, type=float,
+                        help='Slowdown ratio counted as a regression by --compare. '
+                             'Phase times vary by about 15%% between identical runs.')
+    args = parser.parse_args()
+
+    results = {"python": platform.python_version(),
+               "platform": platform.platform(),
+               "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "treeEngine": args.treeEngine,
+               "rasterOutput": args.rasterOutput,
+               "runs": args.runs,
+               "repeats": args.repeats,
+               "results": []}
+    cases = [((size, size), (minSize, minSize)) for size in args.sizes
+             for minSize in args.minNodeSizes if minSize * 2 <= size]
+    calibration = []
+    results["results"] = benchmarkCases(cases, list(range(args.runs)),
+                                        treeEngine=args.treeEngine,
+                                        output=args.rasterOutput,
+                                        repeats=args.repeats,
+                                        calibration=calibration)
+    # The median round, so one noisy calibration doesn't skew every ratio:
+    results["calibrationSeconds"] = sorted(calibration)[len(calibration) // 2]
+    for case in results["results"]:
+        _printCase(case)
+
+    if args.output:
+        with open(args.output, "w") as resultsFile:
+            json.dump(results, resultsFile, indent=2)
+    if args.compare:
+        with open(args.compare) as baselineFile:
+            baseline = json.load(baselineFile)
+        try:
+            regressions = compareResults(baseline, results, args.threshold,
+                                         args.minSeconds)
+        except ValueError as error:
+            print(error)
+            sys.exit(2)
+        for key, phase, ratio in regressions:
+            print("Regression: %s %s is x%.2f slower" %
+                  (_caseName(key), phase, ratio))
+        sys.exit(1 if regressions else 0)
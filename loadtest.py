@@ -0,0 +1,86 @@
+"""
+    Load tests a running pybsp_service: opens a number of concurrent client
+     connections, sends requests as fast as each one gets answered and prints
+     the throughput, client side latency percentiles and the service metrics.
+    Requests have no seed by default, so warm pools can answer them; pass
+     --seeded to give each request its own seed and always generate.
+
+    Run it against a service with e.g.:
+        python loadtest.py --address 127.0.0.1:8765 --requests 500 --concurrency 16
+"""
+import asyncio
+import json
+import time
+
+from pybsp_service import AsyncDungeonClient
+
+async def _clientLoop (address, params, requestIds, latencies, pooledCounts,
+                       seeded):
+    client = await AsyncDungeonClient.connect(address)
+    try:
+        for requestId in requestIds:
+            requestParams = dict(params, seed=requestId) if seeded else params
+            startTime = time.perf_counter()
+            header, packedDungeon = await client.generate(**requestParams)
+            latencies.append(time.perf_counter() - startTime)
+            pooledCounts.append(header["pooled"])
+    finally:
+        await client.close()
+
+async def runLoadTest (address, params, requests=200, concurrency=8,
+                       seeded=False):
+    """
+        Sends requests dungeon requests with params over concurrency
+         connections. Returns a dict of client side results and the service
+         metrics after the run.
+    """
+    latencies = []
+    pooledCounts = []
+    requestIds = iter(range(requests))
+    startTime = time.perf_counter()
+    # Every connection draws request ids from the same iterator:
+    await asyncio.gather(*(_clientLoop(address, params, requestIds, latencies,
+                                       pooledCounts, seeded)
+                           for connection in range(concurrency)))
+    seconds = time.perf_counter() - startTime
+    client = await AsyncDungeonClient.connect(address)
+    metrics = await client.metrics()
+    await client.close()
+
+    latencies.sort()
+    percentile = lambda fraction: latencies[min(int(fraction * len(latencies)),
+                                                len(latencies) - 1)]
+    return {"requests": len(latencies), "seconds": seconds,
+            "requestsPerSecond": len(latencies) / seconds if seconds else 0,
+            "pooled": sum(pooledCounts),
+            "latency": {"mean": sum(latencies) / len(latencies),
+                        "p50": percentile(0.5), "p95": percentile(0.95),
+                        "p99": percentile(0.99), "max": latencies[-1]},
+            "serviceMetrics": metrics}
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Load test a pybsp_service')
+    parser.add_argument('--address', default="127.0.0.1:8765",
+                        help='Service address, host:port or a Unix socket path.')
+    parser.add_argument('--dungeonSize', default=[100, 100], nargs=2, type=int)
+    parser.add_argument('--minNodeSize', default=[20, 20], nargs=2, type=int)
+    parser.add_argument('--requests', default=200, type=int)
+    parser.add_argument('--concurrency', default=8, type=int)
+    parser.add_argument('--seeded', action='store_true',
+                        help='Give every request a seed, bypassing warm pools.')
+    args = parser.parse_args()
+
+    results = asyncio.run(runLoadTest(args.address,
+                                      {"dungeonSize": args.dungeonSize,
+                                       "minNodeSize": args.minNodeSize},
+                                      args.requests, args.concurrency,
+                                      args.seeded))
+    latency = results["latency"]
+    print("%d requests in %.2fs: %.1f requests/s, %d from warm pools" %
+          (results["requests"], results["seconds"],
+           results["requestsPerSecond"], results["pooled"]))
+    print("latency ms: mean %.2f  p50 %.2f  p95 %.2f  p99 %.2f  max %.2f" %
+          tuple(latency[name] * 1000 for name in ("mean", "p50", "p95", "p99",
+                                                  "max")))
+    print(json.dumps(results["serviceMetrics"], indent=2))
@@ -1,4 +1,5 @@
 import random
+import time
 
 def generateDungeon2DList (dungeonSize = (100, 100), minNodeSize = (20, 20),
                            **kwargs):
@@ -6,54 +7,2214 @@ def generateDungeon2DList (dungeonSize = (100, 100), minNodeSize = (20, 20),
         Generates a 2D list dungeon of size dungeonSize.
         Uses the Binary Space Partitioning Method:
         http://www.roguebasin.com/index.php?title=Basic_BSP_Dungeon_generation
+        Pass output="numpy" to get the same tiles as a uint8 numpy array, or
+         output="packed" to get them as a PackedDungeon.
+        Pass treeEngine="flat" to build the tree as a FlatTree, which gives the
+         same dungeon without recursion for very large maps.
+        Pass seed= (or your own random.Random as rng=) to draw every random
+         value from a private generator: the same seed and parameters always
+         give the same dungeon. Without either, the random module is used.
+        Pass batchRooms=True to place all rooms at once with numpy
+         (generateRoomsBatch). Rooms follow the same distribution but are drawn
+         differently, so a seed gives a different dungeon than without it.
+        Pass bridging="tree" to bridge rooms along the tree instead of chaining
+         each room to its closest unbridged room: one bridge per split joins
+         the two subtrees, which takes linear time and always connects every
+         room.
+        Pass ensureConnected=True to add bridges (see repairConnectivity) until
+         every room can be reached.
+        Pass stats=GenerationStats() to record phase timings and counts, and/or
+         onStats=callback to have the filled GenerationStats passed to
+         callback once generation is done. Without them nothing is measured.
     """
+    output = kwargs["output"] if "output" in kwargs else "list"
+    stats = kwargs["stats"] if "stats" in kwargs else None
+    onStats = kwargs["onStats"] if "onStats" in kwargs else None
+    if onStats != None and stats == None:
+        stats = GenerationStats()
+        kwargs["stats"] = stats
+
+    dungeonTree, roomsList, bridgesList = generateDungeonRects(dungeonSize,
+                                                               minNodeSize,
+                                                               **kwargs)
+    dungeon = rasterizeDungeon(dungeonSize, roomsList, bridgesList, output,
+                               stats)
+    if onStats != None:
+        onStats(stats)
+    return dungeon
+
+def generateDungeonRects (dungeonSize = (100, 100), minNodeSize = (20, 20),
+                          **kwargs):
+    """
+        Runs every step of generateDungeon2DList except rasterization and
+         returns (dungeonTree, roomsList, bridgesList).
+        Takes the same arguments as generateDungeon2DList (except output and
+         onStats).
+    """
+    biasRatio = kwargs["biasRatio"] if "biasRatio" in kwargs else 0.75
+    biasStrength = kwargs["biasStrength"] if "biasStrength" in kwargs else 0
+    maxBridgeWidth = kwargs["maxBridgeWidth"] if "maxBridgeWidth" in kwargs else 1
+    treeEngine = kwargs["treeEngine"] if "treeEngine" in kwargs else "recursive"
+    batchRooms = kwargs["batchRooms"] if "batchRooms" in kwargs else False
+    ensureConnected = kwargs["ensureConnected"] if "ensureConnected" in kwargs else False
+    bridging = kwargs["bridging"] if "bridging" in kwargs else "closest"
+    stats = kwargs["stats"] if "stats" in kwargs else None
+    if bridging not in ("closest", "tree"):
+        raise ValueError("Unknown bridging %r" % (bridging,))
+    rng = _createRng(kwargs)
+
+    # Create dungeon tree with partitions:
+    if stats != None:
+        startTime = time.perf_counter()
+    dungeonTree = _createTree(dungeonSize, minNodeSize, treeEngine, rng)
+    if stats != None:
+        stats.addPhaseTime("partition", time.perf_counter() - startTime)
+        stats.recordTree(dungeonTree)
+        startTime = time.perf_counter()
+
+    # Create rooms within the given partitions:
+    # Convert from tree to slices list:
+    if batchRooms:
+        _generateTreeRoomsBatch(dungeonTree, biasRatio, biasStrength, rng)
+    else:
+        dungeonTree.generateTreeRooms(biasRatio, biasStrength, rng)
+    roomsList = dungeonTree.getRoomsList()
+    if stats != None:
+        stats.addPhaseTime("rooms", time.perf_counter() - startTime)
+        stats.roomCount += len(roomsList)
+        startTime = time.perf_counter()
+
+    # Generate bridges between this tree's rooms:
+    if bridging == "tree":
+        dungeonTree.generateTreeBridges(maxBridgeWidth, rng, dungeonSize)
+        bridgesList = dungeonTree.getRoomBridges()
+    else:
+        bridgesList = generateTreeBridges(roomsList, maxBridgeWidth, rng)
+    if ensureConnected:
+        bridgesList.extend(repairConnectivity(dungeonSize, roomsList,
+                                              bridgesList, maxBridgeWidth, rng))
+    if stats != None:
+        stats.addPhaseTime("bridges", time.perf_counter() - startTime)
+        stats.bridgeCount += len(bridgesList)
+    return dungeonTree, roomsList, bridgesList
+
+def _createRng (kwargs):
+    """
+        Returns the random number generator a generation call should use:
+         kwargs["rng"] if given, a new random.Random seeded with kwargs["seed"]
+         if given, or else the shared random module.
+    """
+    if "rng" in kwargs and kwargs["rng"] != None:
+        return kwargs["rng"]
+    if "seed" in kwargs and kwargs["seed"] != None:
+        return random.Random(kwargs["seed"])
+    return random
+
+def _createTree (dungeonSize, minNodeSize, treeEngine, rng=None):
+    """
+        Grows a dungeon tree covering dungeonSize with the given tree engine.
+    """
+    if treeEngine == "recursive":
+        return TreeNode((0,0), dungeonSize, minNodeSize, rng=rng)
+    elif treeEngine == "flat":
+        return FlatTree((0,0), dungeonSize, minNodeSize, rng)
+    raise ValueError("Unknown tree engine %r" % (treeEngine,))
+
+def rasterizeDungeon (dungeonSize, roomsList, bridgesList, output="list",
+                      stats=None):
+    """
+        Fills in a grid of size dungeonSize with the given rooms and bridges.
+        In our 2D grid, rooms and bridges will count as floor (1), everything
+         else is empty space (0).
+        output="list" returns a 2D list, output="numpy" returns a uint8 numpy
+         array indexed [row][col] and output="packed" returns a PackedDungeon,
+         all holding the exact same tiles.
+        If stats (a GenerationStats) is given, the raster time and the number
+         of floor tiles written are added to it.
+    """
+    floorRects = _floorRects(dungeonSize, roomsList, bridgesList)
+    if stats == None:
+        return _rasterizeFloorRects(dungeonSize, floorRects, output)
+
+    startTime = time.perf_counter()
+    floorRects = list(floorRects)
+    dungeon = _rasterizeFloorRects(dungeonSize, floorRects, output)
+    stats.addPhaseTime("raster", time.perf_counter() - startTime)
+    stats.floorTilesWritten += sum((x1 - x0) * (y1 - y0)
+                                   for x0, y0, x1, y1 in floorRects)
+    return dungeon
+
+def _rasterizeFloorRects (gridSize, floorRects, output="list"):
+    """
+        Fills in a grid of size gridSize from floor rects that already lie
+         inside it (see _floorRects), in any rasterizeDungeon output form.
+    """
+    if output == "packed":
+        return PackedDungeon(gridSize, _packFloorRects(gridSize, floorRects))
+    elif output == "numpy":
+        import numpy as np
+        dungeonArray = np.zeros((gridSize[1], gridSize[0]), dtype=np.uint8)
+        # Each rect is a single slice assignment:
+        for x0, y0, x1, y1 in floorRects:
+            dungeonArray[y0:y1, x0:x1] = 1
+        return dungeonArray
+    elif output != "list":
+        raise ValueError("Unknown dungeon output %r" % (output,))
+
+    dungeon2D = [[0 for i in range(gridSize[0])] for j in range(gridSize[1])]
+    # Go through each row of each rect and fill in dungeon2D's floor:
+    for x0, y0, x1, y1 in floorRects:
+        floorRow = [1] * (x1 - x0)
+        for rowNum in range(y0, y1):
+            dungeon2D[rowNum][x0:x1] = floorRow
+    return dungeon2D
+
+def _floorRects (dungeonSize, roomsList, bridgesList):
+    """
+        Yields each room and bridge as an end-exclusive floor rect
+         (x0, y0, x1, y1) that lies fully inside a grid of size dungeonSize.
+        Width=0 bridges are widened by one tile, and negative coordinates wrap
+         around to the far side of the grid the same way 2D list indexing does.
+    """
+    for bounds in roomsList:
+        yield from _roomFloorRects(dungeonSize, bounds)
+    for bounds in bridgesList:
+        yield from _bridgeFloorRects(dungeonSize, bounds)
+
+def _roomFloorRects (dungeonSize, bounds):
+    """
+        Yields the in-grid floor rects of one room, see _floorRects.
+    """
+    x0 = min(bounds[0], bounds[2])
+    y0 = min(bounds[1], bounds[3])
+    x1 = max(bounds[0], bounds[2])
+    y1 = max(bounds[1], bounds[3])
+    return _wrapRect(x0, y0, x1, y1, dungeonSize)
+
+def _bridgeFloorRects (dungeonSize, bounds):
+    """
+        Yields the in-grid floor rects of one bridge, see _floorRects.
+    """
+    x0 = min(bounds[0], bounds[2])
+    y0 = min(bounds[1], bounds[3])
+    x1 = max(bounds[0], bounds[2])
+    y1 = max(bounds[1], bounds[3])
+
+    # Account for width=0 bridges
+    if (x1 - x0 == 0 and x1 + 1 < dungeonSize[0]):
+        x1 += 1
+    elif (x1 - x0 == 0 and x0 - 1 >= 0):
+        x0 -= 1
+
+    if (y1 - y0 == 0 and y1 + 1 < dungeonSize[1]):
+        y1 += 1
+    elif (y1 - y0 == 0 and y0 - 1 >= 0):
+        y0 -= 1
+    return _wrapRect(x0, y0, x1, y1, dungeonSize)
+
+def _wrapRect (x0, y0, x1, y1, dungeonSize):
+    """
+        Splits a rect into the in-grid rects that its tiles end up in.
+    """
+    for colStart, colEnd in _wrapSpan(x0, x1, dungeonSize[0]):
+        for rowStart, rowEnd in _wrapSpan(y0, y1, dungeonSize[1]):
+            yield (colStart, rowStart, colEnd, rowEnd)
+
+def _wrapSpan (start, end, size):
+    """
+        Splits the index range [start, end) into spans within [0, size).
+        Negative indices map to the end of the grid (like list[-1]) and indices
+         past the end are dropped.
+    """
+    spans = []
+    if start < 0:
+        wrapStart = max(start, -size) + size
+        wrapEnd = min(end, 0) + size
+        if wrapStart < wrapEnd:
+            spans.append((wrapStart, wrapEnd))
+        start = 0
+    end = min(end, size)
+    if start < end:
+        spans.append((start, end))
+    return spans
+
+def _packFloorRects (dungeonSize, floorRects):
+    """
+        Rasterizes in-grid floor rects straight into PackedDungeon data.
+        Each row is built up as a single int bit mask, so a rect costs one OR
+         per row it covers.
+    """
+    rowBytes = (dungeonSize[0] + 7) // 8
+    rowBits = rowBytes * 8
+    rowMasks = [0] * dungeonSize[1]
+    for x0, y0, x1, y1 in floorRects:
+        # The leftmost tile is the highest bit of the row:
+        mask = ((1 << (x1 - x0)) - 1) << (rowBits - x1)
+        for rowNum in range(y0, y1):
+            rowMasks[rowNum] |= mask
+    return bytearray().join(rowMask.to_bytes(rowBytes, "big")
+                            for rowMask in rowMasks)
+
+def _cellsOverlapping (cellSize, x0, y0, x1, y1):
+    """
+        Yields the (col, row) of each cellSize grid cell overlapping
+         [x0, x1) x [y0, y1).
+    """
+    if x0 >= x1 or y0 >= y1:
+        return
+    for row in range(y0 // cellSize, (y1 - 1) // cellSize + 1):
+        for col in range(x0 // cellSize, (x1 - 1) // cellSize + 1):
+            yield (col, row)
+
+class PackedDungeon ():
+    """
+        A dungeon's tiles packed at 1 bit per tile, row by row.
+        Each row takes (width + 7) // 8 bytes, and the leftmost tile of a row
+         is the highest bit of its first byte.
+        This is far cheaper to store or send between processes than a 2D list
+         (a 10000x10000 dungeon takes 12.5MB instead of about 800MB). It can
+         be indexed and iterated like one (tiles[y][x], or tiles[y, x] like a
+         numpy array), and tolist() gives back the generateDungeon2DList
+         output.
+        data is the packed bytes; rasterizeDungeon gives a bytearray, which can
+         be edited with fillRow/fillRect and shared without copying through
+         the buffer protocol (memoryview(tiles), or tiles.data before Python
+         3.12).
+    """
+    __slots__ = ("dungeonSize", "data")
+
+    def __init__ (self, dungeonSize, data=None):
+        self.dungeonSize = tuple(dungeonSize)
+        if data == None:
+            data = bytearray(((dungeonSize[0] + 7) // 8) * dungeonSize[1])
+        self.data = data
+
+    @property
+    def rowBytes (self):
+        return (self.dungeonSize[0] + 7) // 8
+
+    def get (self, x, y):
+        """
+            Returns the tile (0 or 1) at column x, row y. Raises IndexError
+             outside the dungeon (negative x and y don't wrap).
+        """
+        if not (0 <= x < self.dungeonSize[0] and 0 <= y < self.dungeonSize[1]):
+            raise IndexError("tile (%d, %d) out of range" % (x, y))
+        tileByte = self.data[y * self.rowBytes + x // 8]
+        return (tileByte >> (7 - x % 8)) & 1
+
+    def row (self, y):
+        """
+            Returns row y unpacked to a list of tiles.
+        """
+        width = self.dungeonSize[0]
+        rowBytes = self.rowBytes
+        if not 0 <= y < self.dungeonSize[1]:
+            raise IndexError("row %d out of range" % y)
+        rowMask = int.from_bytes(self.data[y * rowBytes:(y + 1) * rowBytes],
+                                 "big")
+        rowBits = format(rowMask, "0%db" % (rowBytes * 8))[:width]
+        return list(rowBits.encode().translate(_BIT_TILES))
+
+    def __getitem__ (self, key):
+        if isinstance(key, tuple):
+            y, x = key
+            return self.get(x, y)
+        if key < 0:
+            key += self.dungeonSize[1]
+        return self.row(key)
+
+    def __len__ (self):
+        return self.dungeonSize[1]
+
+    def __iter__ (self):
+        for y in range(self.dungeonSize[1]):
+            yield self.row(y)
+
+    def __buffer__ (self, flags):
+        return memoryview(self.data)
+
+    def __release_buffer__ (self, view):
+        view.release()
+
+    def fillRow (self, y, x0, x1, value=1):
+        """
+            Sets tiles [x0, x1) of row y to value (0 or 1). Raises IndexError
+             if they don't lie inside the dungeon.
+        """
+        if not (0 <= y < self.dungeonSize[1] and 0 <= x0 and
+                x1 <= self.dungeonSize[0]):
+            raise IndexError("row %d tiles [%d, %d) out of range" % (y, x0, x1))
+        if x0 >= x1:
+            return
+        rowStart = y * self.rowBytes
+        firstByte = rowStart + x0 // 8
+        lastByte = rowStart + (x1 - 1) // 8
+        firstMask = 0xFF >> (x0 % 8)
+        lastMask = (0xFF << (7 - (x1 - 1) % 8)) & 0xFF
+        data = self.data
+        if firstByte == lastByte:
+            firstMask &= lastMask
+        if value:
+            data[firstByte] |= firstMask
+            if firstByte != lastByte:
+                data[firstByte + 1:lastByte] = b"\xff" * (lastByte - firstByte
+                                                          - 1)
+                data[lastByte] |= lastMask
+        else:
+            data[firstByte] &= ~firstMask & 0xFF
+            if firstByte != lastByte:
+                data[firstByte + 1:lastByte] = bytes(lastByte - firstByte - 1)
+                data[lastByte] &= ~lastMask & 0xFF
+
+    def fillRect (self, x0, y0, x1, y1, value=1):
+        """
+            Sets the tiles of the end-exclusive rect (x0, y0, x1, y1) to value.
+            Raises IndexError if the rect doesn't lie inside the dungeon.
+        """
+        if not (0 <= x0 and 0 <= y0 and x1 <= self.dungeonSize[0] and
+                y1 <= self.dungeonSize[1]):
+            raise IndexError("rect (%d, %d, %d, %d) out of range" %
+                             (x0, y0, x1, y1))
+        for y in range(y0, y1):
+            self.fillRow(y, x0, x1, value)
+
+    def tolist (self):
+        """
+            Unpacks the tiles into a 2D list like generateDungeon2DList's.
+        """
+        return list(self)
+
+# Maps the binary digits of a row's bit mask to tiles:
+_BIT_TILES = bytes.maketrans(b"01", b"\x00\x01")
+
+# --- Generation Metrics ---
+class GenerationStats ():
+    """
+        Metrics about a dungeon generation, filled in when passed as stats= to
+         generateDungeon2DList, generateDungeonRects or rasterizeDungeon:
+         - phaseSeconds: wall time of each phase ("partition", "rooms",
+          "bridges" and "raster")
+         - nodeCount and maxDepth: size and deepest iteration of the tree
+         - roomCount and bridgeCount: number of room and bridge rects
+         - floorTilesWritten: tile writes made by rasterization (a tile
+          covered by two rects counts twice)
+        Reusing one object across generations accumulates the metrics.
+        Code driving TreeNode itself can fill one with addPhaseTime and
+         recordTree.
+    """
+    def __init__ (self):
+        self.phaseSeconds = {}
+        self.nodeCount = 0
+        self.maxDepth = 0
+        self.roomCount = 0
+        self.bridgeCount = 0
+        self.floorTilesWritten = 0
+
+    def addPhaseTime (self, phase, seconds):
+        self.phaseSeconds[phase] = self.phaseSeconds.get(phase, 0) + seconds
+
+    @property
+    def totalSeconds (self):
+        return sum(self.phaseSeconds.values())
+
+    def recordTree (self, dungeonTree):
+        """
+            Adds the node count and max depth of a TreeNode or FlatTree.
+        """
+        if isinstance(dungeonTree, FlatTree):
+            self.nodeCount += len(dungeonTree)
+            self.maxDepth = max(self.maxDepth, max(dungeonTree.iterations))
+            return
+        # Walk the TreeNode with a stack, deep trees can't recurse:
+        nodes = [dungeonTree]
+        while nodes:
+            node = nodes.pop()
+            self.nodeCount += 1
+            self.maxDepth = max(self.maxDepth, node.iteration)
+            if node.beforeSplitNode != None:
+                nodes.append(node.beforeSplitNode)
+            if node.afterSplitNode != None:
+                nodes.append(node.afterSplitNode)
+
+    def asDict (self):
+        return {"phaseSeconds": dict(self.phaseSeconds),
+                "totalSeconds": self.totalSeconds,
+                "nodeCount": self.nodeCount, "maxDepth": self.maxDepth,
+                "roomCount": self.roomCount, "bridgeCount": self.bridgeCount,
+                "floorTilesWritten": self.floorTilesWritten}
+
+    def __str__ (self):
+        phases = " ".join("%s=%.4fs" % (phase, seconds)
+                          for phase, seconds in self.phaseSeconds.items())
+        return ("%s nodes=%d maxDepth=%d rooms=%d bridges=%d floorTiles=%d" %
+                (phases, self.nodeCount, self.maxDepth, self.roomCount,
+                 self.bridgeCount, self.floorTilesWritten))
+# --- ---
+
+# --- Chunked Worlds ---
+class ChunkedDungeon ():
+    """
+        A dungeon that is only rasterized one chunk at a time, for worlds far
+         too large to hold as a single grid.
+        The tree, rooms and bridges are generated up front (with the same
+         arguments as generateDungeon2DList, using the flat tree engine unless
+         told otherwise) and their floor rects are bucketed by the chunks they
+         overlap. getChunk((cx, cy)) then rasterizes just the rects in that
+         chunk, and keeps the result in an LRU cache of maxCachedChunks chunks.
+        Chunk tiles are exactly the tiles of the same area of the full dungeon.
+    """
+    def __init__ (self, dungeonSize, minNodeSize, chunkSize=(256, 256),
+                  maxCachedChunks=64, **kwargs):
+        from collections import OrderedDict
+
+        if "treeEngine" not in kwargs:
+            kwargs["treeEngine"] = "flat"
+        self.dungeonSize = tuple(dungeonSize)
+        self.chunkSize = tuple(chunkSize)
+        self.output = kwargs["output"] if "output" in kwargs else "list"
+        self.maxCachedChunks = maxCachedChunks
+        self.dungeonTree, self.roomsList, self.bridgesList = \
+            generateDungeonRects(dungeonSize, minNodeSize, **kwargs)
+
+        # Bucket every floor rect under each chunk it overlaps:
+        self.floorRects = list(_floorRects(self.dungeonSize, self.roomsList,
+                                           self.bridgesList))
+        self.chunkRects = {}
+        chunkWidth, chunkHeight = self.chunkSize
+        for rectIndex, (x0, y0, x1, y1) in enumerate(self.floorRects):
+            for cy in range(y0 // chunkHeight, (y1 - 1) // chunkHeight + 1):
+                for cx in range(x0 // chunkWidth, (x1 - 1) // chunkWidth + 1):
+                    self.chunkRects.setdefault((cx, cy), []).append(rectIndex)
+        self.chunkCache = OrderedDict()
+
+    @property
+    def chunkCounts (self):
+        """
+            The number of chunk columns and rows covering the dungeon.
+        """
+        return (-(-self.dungeonSize[0] // self.chunkSize[0]),
+                -(-self.dungeonSize[1] // self.chunkSize[1]))
+
+    def getChunkBounds (self, chunk):
+        """
+            Returns the (x0, y0, x1, y1) tiles covered by chunk (cx, cy).
+            Chunks on the far edges may be smaller than chunkSize.
+        """
+        cx, cy = chunk
+        if not (0 <= cx < self.chunkCounts[0] and
+                0 <= cy < self.chunkCounts[1]):
+            raise IndexError("Chunk %r is outside the dungeon" % (chunk,))
+        x0 = cx * self.chunkSize[0]
+        y0 = cy * self.chunkSize[1]
+        return (x0, y0, min(x0 + self.chunkSize[0], self.dungeonSize[0]),
+                min(y0 + self.chunkSize[1], self.dungeonSize[1]))
+
+    def getChunk (self, chunk):
+        """
+            Returns the tiles of chunk (cx, cy) in the dungeon's output form,
+             indexed [row][col] relative to the chunk's top left tile.
+        """
+        chunk = tuple(chunk)
+        if chunk in self.chunkCache:
+            self.chunkCache.move_to_end(chunk)
+            return self.chunkCache[chunk]
+        chunkTiles = self._rasterizeChunk(chunk)
+        self.chunkCache[chunk] = chunkTiles
+        if len(self.chunkCache) > self.maxCachedChunks:
+            self.chunkCache.popitem(last=False) # Least recently used.
+        return chunkTiles
+
+    def _rasterizeChunk (self, chunk):
+        x0, y0, x1, y1 = self.getChunkBounds(chunk)
+        chunkRects = []
+        for rectIndex in self.chunkRects.get(chunk, ()):
+            rect = self.floorRects[rectIndex]
+            # Clip the rect to the chunk and move it to chunk coordinates:
+            chunkRects.append((max(rect[0], x0) - x0, max(rect[1], y0) - y0,
+                               min(rect[2], x1) - x0, min(rect[3], y1) - y0))
+        return _rasterizeFloorRects((x1 - x0, y1 - y0), chunkRects,
+                                    self.output)
+
+    def get (self, x, y):
+        """
+            Returns the tile (0 or 1) at column x, row y of the dungeon.
+        """
+        chunk = (x // self.chunkSize[0], y // self.chunkSize[1])
+        chunkTiles = self.getChunk(chunk)
+        localX = x % self.chunkSize[0]
+        localY = y % self.chunkSize[1]
+        if self.output == "packed":
+            return chunkTiles.get(localX, localY)
+        return int(chunkTiles[localY][localX])
+# --- ---
+
+# --- Editable Dungeons ---
+class EditableDungeon ():
+    """
+        A generated dungeon that keeps its TreeNode tree, bridges and tiles so
+         that a single region can be re-rolled with regenerateSubtree.
+        Takes the same arguments as generateDungeon2DList (output may be "list",
+         "numpy" or "packed") and starts out with exactly the dungeon that call would
+         generate. tiles is the grid, which edits update in place.
+        Each bridge is kept as a link between the two leaf nodes whose rooms it
+         connects, and every room and bridge floor rect is bucketed in a grid,
+         so an edit only touches the rooms, bridges and tiles near its region.
+         With ensureConnected=True an edit also bridges whatever it cut off,
+         searching only the floor between the rooms and bridges it changed.
+    """
+    def __init__ (self, dungeonSize = (100, 100), minNodeSize = (20, 20),
+                  **kwargs):
+        self.dungeonSize = tuple(dungeonSize)
+        self.minNodeSize = tuple(minNodeSize)
+        self.biasRatio = kwargs["biasRatio"] if "biasRatio" in kwargs else 0.75
+        self.biasStrength = kwargs["biasStrength"] if "biasStrength" in kwargs else 0
+        self.maxBridgeWidth = kwargs["maxBridgeWidth"] if "maxBridgeWidth" in kwargs else 1
+        self.output = kwargs["output"] if "output" in kwargs else "list"
+        self.batchRooms = kwargs["batchRooms"] if "batchRooms" in kwargs else False
+        self.bridging = kwargs["bridging"] if "bridging" in kwargs else "closest"
+        self.ensureConnected = kwargs["ensureConnected"] if "ensureConnected" in kwargs else False
+        if self.bridging not in ("closest", "tree"):
+            raise ValueError("Unknown bridging %r" % (self.bridging,))
+        self.rng = _createRng(kwargs)
+
+        self.dungeonTree = TreeNode((0,0), self.dungeonSize, self.minNodeSize,
+                                    rng=self.rng)
+        self._generateRooms(self.dungeonTree, self.rng)
+        self.rectBuckets = _RectBuckets(2 * max(self.minNodeSize))
+        self.links = {} # Ordered set of _BridgeLinks, in bridge order.
+        self.roomLinks = {} # Leaf node -> the _BridgeLinks touching its room.
+        leaves = _getLeaves(self.dungeonTree)
+        for leaf in leaves:
+            self._addRoom(leaf)
+        self._bridgeSubtree(self.dungeonTree, leaves, self.rng)
+        if self.ensureConnected:
+            self._repairLinks(self.rng)
+        self.tiles = rasterizeDungeon(self.dungeonSize, self.getRoomsList(),
+                                      self.getBridgesList(), self.output)
+
+    def getRoomsList (self):
+        return self.dungeonTree.getRoomsList()
+
+    def getBridgesList (self):
+        return [rect for link in self.links for rect in link.rects]
+
+    def findNode (self, x, y, depth=None):
+        """
+            Returns the deepest node containing tile (x, y), going no deeper
+             than iteration depth if given.
+        """
+        node = self.dungeonTree
+        while node.beforeSplitNode != None and (depth == None or
+                                                node.iteration < depth):
+            afterSplitNode = node.afterSplitNode
+            if x >= afterSplitNode.origin[0] and y >= afterSplitNode.origin[1]:
+                node = afterSplitNode
+            else:
+                node = node.beforeSplitNode
+        return node
+
+    def regenerateSubtree (self, node, seed=None, rng=None):
+        """
+            Re-rolls the splits and rooms under node (a TreeNode of this
+             dungeon's tree, see findNode) and updates tiles in place.
+            Bridges inside the subtree are regenerated the dungeon's bridging
+             way. Each bridge that led into the subtree from outside is rebuilt
+             to the new room closest to its outside room, or with tree bridging,
+             to the new room facing its split (see _bridgeSiblings).
+            Draws from rng, a new random.Random(seed), or the dungeon's own rng.
+            Returns the (x0, y0, x1, y1) rect of tiles that was re-rasterized.
+        """
+        if rng == None:
+            rng = random.Random(seed) if seed != None else self.rng
+        partition = (node.origin[0], node.origin[1],
+                     node.bounds[0], node.bounds[1])
+        dirtyRects = [partition]
+
+        # Take out the old rooms and every bridge touching them:
+        oldLeaves = _getLeaves(node)
+        oldLeafSet = set(oldLeaves)
+        touchingLinks = {}
+        for leaf in oldLeaves:
+            dirtyRects.extend(self.rectBuckets.remove(leaf))
+            for link in self.roomLinks.pop(leaf):
+                touchingLinks[link] = None
+        reconnections = []
+        for link in touchingLinks:
+            dirtyRects.extend(self.rectBuckets.remove(link))
+            del self.links[link]
+            if link.nodeA in oldLeafSet and link.nodeB in oldLeafSet:
+                continue
+            # Bridges from outside get rebuilt in the same direction:
+            isOutsideFirst = link.nodeA not in oldLeafSet
+            outsideNode = link.nodeA if isOutsideFirst else link.nodeB
+            self.roomLinks[outsideNode].remove(link)
+            reconnections.append((outsideNode, isOutsideFirst,
+                                  link.splitNode))
+        if self.ensureConnected:
+            # Floor that touched what was taken out may now be cut off:
+            seedRects = self.rectBuckets.touching(dirtyRects[1:])
+
+        # Regrow the subtree and its rooms:
+        node.beforeSplitNode = None
+        node.afterSplitNode = None
+        node.roomBounds = None
+        node._growTree(self.minNodeSize, rng)
+        self._generateRooms(node, rng)
+        newLeaves = _getLeaves(node)
+        newRooms = [leaf.roomBounds for leaf in newLeaves]
+        for leaf in newLeaves:
+            dirtyRects.extend(self._addRoom(leaf))
+
+        # Bridge the new rooms, then reconnect the rest of the dungeon:
+        newLinks, subtreeExtremes = self._bridgeSubtree(node, newLeaves, rng)
+        roomLeaves = dict((leaf.roomBounds, leaf) for leaf in newLeaves)
+        for outsideNode, isOutsideFirst, splitNode in reconnections:
+            if splitNode != None:
+                newLinks.append(self._rejoinSplit(splitNode, outsideNode,
+                                                  isOutsideFirst,
+                                                  subtreeExtremes, roomLeaves,
+                                                  rng))
+                continue
+            closestLeaf = newLeaves[_closestRoomIndex(outsideNode.roomBounds,
+                                                      newRooms)]
+            nodeA, nodeB = (outsideNode, closestLeaf) if isOutsideFirst else \
+                (closestLeaf, outsideNode)
+            newLinks.append(self._addLink(nodeA, nodeB, generateBridge(
+                nodeA.roomBounds, nodeB.roomBounds, self.maxBridgeWidth, rng)))
+        if self.ensureConnected:
+            for key in newLeaves + newLinks + [outsideNode for outsideNode,
+                                               isOutsideFirst, splitNode in
+                                               reconnections]:
+                seedRects.update(((key, rectIndex), None) for rectIndex in
+                                 range(len(self.rectBuckets.rects[key])))
+            newLinks.extend(self._reconnect(seedRects, rng))
+        for link in newLinks:
+            dirtyRects.extend(self.rectBuckets.rects[link])
+
+        dirtyRect = (max(min(rect[0] for rect in dirtyRects), 0),
+                     max(min(rect[1] for rect in dirtyRects), 0),
+                     min(max(rect[2] for rect in dirtyRects),
+                         self.dungeonSize[0]),
+                     min(max(rect[3] for rect in dirtyRects),
+                         self.dungeonSize[1]))
+        self._rerasterize(dirtyRect)
+        return dirtyRect
+
+    def _generateRooms (self, node, rng):
+        if self.batchRooms:
+            _generateTreeRoomsBatch(node, self.biasRatio, self.biasStrength, rng)
+        else:
+            node.generateTreeRooms(self.biasRatio, self.biasStrength, rng)
+
+    def _bridgeSubtree (self, node, leaves, rng):
+        """
+            Bridges the rooms of the subtree under node, whose leaves are
+             leaves. Returns (new links, the subtree's extreme rooms with tree
+             bridging or else None).
+        """
+        if self.bridging == "tree":
+            node.generateTreeBridges(self.maxBridgeWidth, rng, self.dungeonSize)
+            roomLeaves = dict((leaf.roomBounds, leaf) for leaf in leaves)
+            extremes, joins = _treeBridgeRooms(node)
+            return ([self._addLink(roomLeaves[room1], roomLeaves[room2],
+                                   splitNode.bridges, splitNode)
+                     for splitNode, room1, room2 in joins], extremes)
+        return ([self._addLink(leaves[currentIndex], leaves[closestIndex],
+                               generateBridge(leaves[currentIndex].roomBounds,
+                                              leaves[closestIndex].roomBounds,
+                                              self.maxBridgeWidth, rng))
+                 for currentIndex, closestIndex in
+                 _closestRoomChain([leaf.roomBounds for leaf in leaves])],
+                None)
+
+    def _rejoinSplit (self, splitNode, outsideNode, isOutsideFirst,
+                      subtreeExtremes, roomLeaves, rng):
+        """
+            Rebuilds the tree bridge of splitNode between outsideNode's room
+             and the regenerated subtree's room facing it. Returns its link.
+        """
+        isVerticalSplit = splitNode.afterSplitNode.origin[0] != \
+            splitNode.origin[0]
+        outsideExtremes = _roomExtremes(outsideNode.roomBounds)
+        if isOutsideFirst:
+            beforeExtremes, afterExtremes = outsideExtremes, subtreeExtremes
+        else:
+            beforeExtremes, afterExtremes = subtreeExtremes, outsideExtremes
+        splitNode.bridges = _bridgeSiblings(self.dungeonSize, beforeExtremes,
+                                            afterExtremes, isVerticalSplit,
+                                            self.maxBridgeWidth, rng)[0]
+        room1, room2 = _siblingRooms(beforeExtremes, afterExtremes,
+                                     isVerticalSplit)
+        if isOutsideFirst:
+            return self._addLink(outsideNode, roomLeaves[room2],
+                                 splitNode.bridges, splitNode)
+        return self._addLink(roomLeaves[room1], outsideNode, splitNode.bridges,
+                             splitNode)
+
+    def _repairLinks (self, rng):
+        """
+            Links the bridges repairConnectivity adds to connect every room.
+             Returns the new links.
+        """
+        leaves = _getLeaves(self.dungeonTree)
+        return [self._addLink(leaves[mainRoomIndex], leaves[roomIndex], bridge)
+                for roomIndex, mainRoomIndex, bridge in _repairBridges(
+                    self.dungeonSize, [leaf.roomBounds for leaf in leaves],
+                    self.getBridgesList(), self.maxBridgeWidth, rng)]
+
+    def _reconnect (self, seedRects, rng):
+        """
+            Makes the rooms and bridges of seedRects, (key, rect index) pairs
+             from rectBuckets, reach each other again. A search runs out
+             from each rect at once, and searches merge when their floor meets.
+             A search that runs out of floor first gets its rooms bridged to
+             the closest room outside them.
+            The dungeon was connected before the edit, so every piece it may
+             have cut off holds a seed, and only the floor between the seeds
+             is searched. Returns the new links.
+        """
+        from collections import deque
+        owners = {} # (key, rect index) -> index of the search that reached it
+        parents = [] # Union-find over searches.
+        queues = [] # Rects each root search has left to expand.
+        for seedRect in seedRects:
+            if seedRect not in owners:
+                owners[seedRect] = len(parents)
+                parents.append(len(parents))
+                queues.append(deque([seedRect]))
+
+        def find (search):
+            while parents[search] != search:
+                parents[search] = parents[parents[search]] # Path halving.
+                search = parents[search]
+            return search
+
+        activeSearches = set(range(len(parents)))
+        turns = deque(range(len(parents)))
+        newLinks = []
+        while len(activeSearches) > 1 and turns:
+            search = turns.popleft()
+            if find(search) != search or search not in activeSearches:
+                continue
+            if queues[search]:
+                key, rectIndex = queues[search].popleft()
+                touched = self.rectBuckets.touching(
+                    [self.rectBuckets.rects[key][rectIndex]])
+            else:
+                # This search's floor is cut off from the others:
+                link = self._bridgeOut([key for (key, rectIndex), owner in
+                                        owners.items() if rectIndex == 0 and
+                                        find(owner) == search], rng)
+                if link == None:
+                    activeSearches.discard(search)
+                    continue
+                newLinks.append(link)
+                # The room bridged to is a room's floor like any other:
+                touched = [(link.nodeA, 0)]
+            for otherRect in touched:
+                if otherRect not in owners:
+                    owners[otherRect] = search
+                    queues[search].append(otherRect)
+                    continue
+                otherSearch = find(owners[otherRect])
+                if otherSearch == search:
+                    continue
+                # Merge the other search into this one:
+                parents[otherSearch] = search
+                queues[search].extend(queues[otherSearch])
+                queues[otherSearch] = None
+                if otherSearch in activeSearches:
+                    activeSearches.discard(otherSearch)
+                    activeSearches.add(search)
+            turns.append(search)
+        return newLinks
+
+    def _bridgeOut (self, reachedKeys, rng):
+        """
+            Links the closest pair of rooms between the rooms among reachedKeys
+             (by their first floor rect, like checkConnectivity) and the rooms
+             outside them. Returns the new link, or None if there is no such
+             pair (e.g. no rooms reached).
+        """
+        rooms = [key for key in reachedKeys if not isinstance(key, _BridgeLink)]
+        if not rooms:
+            return None
+        roomSet = set(rooms)
+        rects = [rect for key in rooms for rect in self.rectBuckets.rects[key]]
+        x0 = min(rect[0] for rect in rects)
+        y0 = min(rect[1] for rect in rects)
+        x1 = max(rect[2] for rect in rects)
+        y1 = max(rect[3] for rect in rects)
+        # Look further out until there are rooms around to bridge to:
+        margin = self.rectBuckets.cellSize
+        while True:
+            otherRooms = [key for key in self.rectBuckets.keysIn(
+                              x0 - margin, y0 - margin, x1 + margin,
+                              y1 + margin)
+                          if key not in roomSet and
+                          not isinstance(key, _BridgeLink)]
+            if otherRooms:
+                break
+            if margin > max(self.dungeonSize):
+                return None
+            margin *= 2
+        roomsList = [leaf.roomBounds for leaf in rooms + otherRooms]
+        roomIndex, otherIndex = _closestRoomPair(
+            roomsList, list(range(len(rooms))),
+            list(range(len(rooms), len(roomsList))))
+        room, otherRoom = rooms[roomIndex], otherRooms[otherIndex - len(rooms)]
+        bridge = generateBridge(otherRoom.roomBounds, room.roomBounds,
+                                self.maxBridgeWidth, rng)
+        if not _bridgeJoins(self.dungeonSize, otherRoom.roomBounds,
+                            room.roomBounds, bridge):
+            bridge.extend(_lCorridor(otherRoom.roomBounds, room.roomBounds))
+        return self._addLink(otherRoom, room, bridge)
+
+    def _addRoom (self, leaf):
+        roomRects = list(_roomFloorRects(self.dungeonSize, leaf.roomBounds))
+        self.rectBuckets.add(leaf, roomRects)
+        self.roomLinks[leaf] = []
+        return roomRects
+
+    def _addLink (self, nodeA, nodeB, rects, splitNode=None):
+        link = _BridgeLink(nodeA, nodeB, rects, splitNode)
+        self.links[link] = None
+        self.roomLinks[nodeA].append(link)
+        self.roomLinks[nodeB].append(link)
+        self.rectBuckets.add(link, [floorRect for bounds in link.rects
+                                    for floorRect in
+                                    _bridgeFloorRects(self.dungeonSize,
+                                                      bounds)])
+        return link
+
+    def _rerasterize (self, dirtyRect):
+        """
+            Clears the tiles of dirtyRect, then fills in the floor rects that
+             overlap it.
+        """
+        x0, y0, x1, y1 = dirtyRect
+        if x0 >= x1 or y0 >= y1:
+            return
+        _fillTiles(self.tiles, dirtyRect, 0, self.output)
+        for rect in self.rectBuckets.rectsIn(x0, y0, x1, y1):
+            _fillTiles(self.tiles, (max(rect[0], x0), max(rect[1], y0),
+                                    min(rect[2], x1), min(rect[3], y1)),
+                       1, self.output)
+
+class _BridgeLink ():
+    """
+        The bridge rects made between the rooms of two leaves. splitNode is the
+         node whose subtrees a tree bridge joins (nodeA's room is in its before
+         split subtree), or None for other bridges.
+    """
+    __slots__ = ("nodeA", "nodeB", "rects", "splitNode")
+
+    def __init__ (self, nodeA, nodeB, rects, splitNode=None):
+        self.nodeA = nodeA
+        self.nodeB = nodeB
+        self.rects = rects
+        self.splitNode = splitNode
+
+class _RectBuckets ():
+    """
+        In-grid floor rects grouped under keys and bucketed in a grid of
+         cellSize cells, so the rects near an area can be found and removed
+         without scanning them all.
+    """
+    def __init__ (self, cellSize):
+        self.cellSize = cellSize
+        self.rects = {} # key -> list of rects
+        self.cells = {} # (col, row) -> ordered set of keys
+
+    def add (self, key, rects):
+        self.rects[key] = rects
+        for rect in rects:
+            for cell in _cellsOverlapping(self.cellSize, *rect):
+                self.cells.setdefault(cell, {})[key] = None
+
+    def remove (self, key):
+        """
+            Removes and returns the rects stored under key.
+        """
+        rects = self.rects.pop(key)
+        for rect in rects:
+            for cell in _cellsOverlapping(self.cellSize, *rect):
+                cellKeys = self.cells.get(cell)
+                if cellKeys != None:
+                    cellKeys.pop(key, None)
+        return rects
+
+    def keysIn (self, x0, y0, x1, y1):
+        """
+            Returns the keys with a rect overlapping [x0, x1) x [y0, y1).
+        """
+        keys = {}
+        for cell in _cellsOverlapping(self.cellSize, x0, y0, x1, y1):
+            for key in self.cells.get(cell, ()):
+                if key not in keys and any(
+                        rect[0] < x1 and x0 < rect[2] and rect[1] < y1 and
+                        y0 < rect[3] for rect in self.rects[key]):
+                    keys[key] = None
+        return list(keys)
+
+    def touching (self, rects):
+        """
+            Returns the (key, rect index) of every stored rect sharing a tile or
+             a tile edge with any of rects, as an ordered set (a dict).
+            The rects of one key are told apart because they need not touch
+             each other (a rect that wraps around the grid is split in two).
+        """
+        touched = {}
+        for rect in rects:
+            for cell in _cellsOverlapping(self.cellSize, rect[0] - 1,
+                                          rect[1] - 1, rect[2] + 1,
+                                          rect[3] + 1):
+                for key in self.cells.get(cell, ()):
+                    for rectIndex, other in enumerate(self.rects[key]):
+                        if _rectsConnect(rect, other):
+                            touched[(key, rectIndex)] = None
+        return touched
+
+    def rectsIn (self, x0, y0, x1, y1):
+        """
+            Yields every stored rect overlapping [x0, x1) x [y0, y1).
+        """
+        keys = {}
+        for cell in _cellsOverlapping(self.cellSize, x0, y0, x1, y1):
+            keys.update(self.cells.get(cell, {}))
+        for key in keys:
+            for rect in self.rects[key]:
+                if rect[0] < x1 and x0 < rect[2] and rect[1] < y1 and \
+                        y0 < rect[3]:
+                    yield rect
+
+def _getLeaves (node):
+    """
+        Returns the leaf TreeNodes under node, in TreeNode order.
+    """
+    leaves = []
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        if node.beforeSplitNode == None:
+            leaves.append(node)
+        else:
+            nodes.append(node.afterSplitNode)
+            nodes.append(node.beforeSplitNode)
+    return leaves
+
+def _closestRoomIndex (room, roomList):
+    """
+        Returns the index of the room in roomList closest to room, measured like
+         findClosestRoom. Ties go to the earliest room.
+    """
+    return _closestCenterIndex(_roomCenter(room),
+                               [_roomCenter(compareRoom)
+                                for compareRoom in roomList],
+                               range(len(roomList)))
+
+def _fillTiles (tiles, rect, value, output):
+    """
+        Sets every tile of rect to value in a 2D list, numpy grid or
+         PackedDungeon.
+    """
+    x0, y0, x1, y1 = rect
+    if x0 >= x1 or y0 >= y1:
+        return
+    if output == "packed":
+        tiles.fillRect(x0, y0, x1, y1, value)
+        return
+    if output == "numpy":
+        tiles[y0:y1, x0:x1] = value
+        return
+    tileRow = [value] * (x1 - x0)
+    for rowNum in range(y0, y1):
+        tiles[rowNum][x0:x1] = tileRow
+# --- ---
+
+# --- Tile Queries ---
+class DungeonQuery ():
+    """
+        Answers tile queries straight from a dungeon's rooms and bridges,
+         without rasterizing it.
+        Floor rects are bucketed in a grid of cellSize tiles (by default about
+         the size of one room per cell), so a point query only checks the few
+         rects in its cell. Results match the tiles rasterizeDungeon would
+         give, including the width=0 bridge widening.
+    """
+    def __init__ (self, dungeonSize, roomsList, bridgesList, cellSize=None):
+        self.dungeonSize = tuple(dungeonSize)
+        if cellSize == None:
+            area = dungeonSize[0] * dungeonSize[1]
+            cellSize = max(8, int((area / max(len(roomsList), 1)) ** 0.5))
+        self.cellSize = cellSize
+        # Each floor rect is stored as (x0, y0, x1, y1, roomIndex) where
+        #  roomIndex is -1 for bridges:
+        self.floorRects = []
+        for roomIndex, bounds in enumerate(roomsList):
+            for rect in _roomFloorRects(self.dungeonSize, bounds):
+                self.floorRects.append(rect + (roomIndex,))
+        for bounds in bridgesList:
+            for rect in _bridgeFloorRects(self.dungeonSize, bounds):
+                self.floorRects.append(rect + (-1,))
+        self.cells = {}
+        for rectIndex, rect in enumerate(self.floorRects):
+            for cell in _cellsOverlapping(self.cellSize, rect[0], rect[1],
+                                          rect[2], rect[3]):
+                self.cells.setdefault(cell, []).append(rectIndex)
+
+    def _rectsAt (self, x, y):
+        cell = (x // self.cellSize, y // self.cellSize)
+        for rectIndex in self.cells.get(cell, ()):
+            rect = self.floorRects[rectIndex]
+            if rect[0] <= x < rect[2] and rect[1] <= y < rect[3]:
+                yield rect
+
+    def isFloor (self, x, y):
+        """
+            Returns True if tile (x, y) is floor.
+        """
+        for rect in self._rectsAt(x, y):
+            return True
+        return False
+
+    def roomAt (self, x, y):
+        """
+            Returns the index in roomsList of the room containing tile (x, y),
+             or None if it is not inside a room. If rooms overlap, the lowest
+             index wins.
+        """
+        roomIndices = [rect[4] for rect in self._rectsAt(x, y) if rect[4] != -1]
+        return min(roomIndices) if roomIndices else None
+
+    def floorRectsIn (self, x0, y0, x1, y1):
+        """
+            Returns the floor rects overlapping [x0, x1) x [y0, y1), clipped to
+             it. Rects may overlap each other.
+        """
+        clippedRects = []
+        for rectIndex in self._rectIndicesIn(x0, y0, x1, y1):
+            rect = self.floorRects[rectIndex]
+            clippedRects.append((max(rect[0], x0), max(rect[1], y0),
+                                 min(rect[2], x1), min(rect[3], y1)))
+        return clippedRects
+
+    def roomsIn (self, x0, y0, x1, y1):
+        """
+            Returns the sorted indices of the rooms with floor inside
+             [x0, x1) x [y0, y1).
+        """
+        return sorted(set(self.floorRects[rectIndex][4] for rectIndex in
+                          self._rectIndicesIn(x0, y0, x1, y1)
+                          if self.floorRects[rectIndex][4] != -1))
+
+    def _rectIndicesIn (self, x0, y0, x1, y1):
+        """
+            Returns the indices of the floor rects overlapping
+             [x0, x1) x [y0, y1), in floorRects order.
+        """
+        rectIndices = set()
+        for cell in _cellsOverlapping(self.cellSize, max(x0, 0), max(y0, 0),
+                                      min(x1, self.dungeonSize[0]),
+                                      min(y1, self.dungeonSize[1])):
+            for rectIndex in self.cells.get(cell, ()):
+                rect = self.floorRects[rectIndex]
+                if rect[0] < x1 and x0 < rect[2] and rect[1] < y1 and \
+                        y0 < rect[3]:
+                    rectIndices.add(rectIndex)
+        return sorted(rectIndices)
+
+    def toGrid (self, x0, y0, x1, y1, output="list"):
+        """
+            Rasterizes just the tiles of [x0, x1) x [y0, y1), in any
+             rasterizeDungeon output form.
+        """
+        return _rasterizeFloorRects((x1 - x0, y1 - y0),
+                                    [(rx0 - x0, ry0 - y0, rx1 - x0, ry1 - y0)
+                                     for rx0, ry0, rx1, ry1 in
+                                     self.floorRectsIn(x0, y0, x1, y1)],
+                                    output)
+# --- ---
+
+# --- Connectivity ---
+def checkConnectivity (dungeonSize, roomsList, bridgesList):
+    """
+        Finds which rooms can reach each other over floor tiles, without
+         rasterizing the dungeon.
+        Floor rects are joined with union-find when they overlap or share an
+         edge (tiles connect up, down, left and right, not diagonally), using a
+         grid of buckets to only compare nearby rects.
+        Returns (components, unreachableRooms): components is a list of lists
+         of room indices, the main component (most rooms, then earliest room)
+         first; unreachableRooms lists every room outside the main component.
+    """
+    floorGraph = _FloorGraph(dungeonSize, len(roomsList))
+    roomRects = [floorGraph.addRoom(bounds) for bounds in roomsList]
+    for bounds in bridgesList:
+        floorGraph.addBridge(bounds)
+    return _roomComponents(floorGraph, roomRects)
+
+def repairConnectivity (dungeonSize, roomsList, bridgesList, maxBridgeWidth=1,
+                        rng=None):
+    """
+        Returns the bridges that need to be added to bridgesList so that every
+         room can be reached (see checkConnectivity).
+        Each smaller component is joined to the main one between their closest
+         pair of rooms, with generateBridge if that bridge connects them, or
+         else with an L-shaped corridor between the two room centers.
+    """
+    return [bounds for roomIndex, mainRoomIndex, bridge in
+            _repairBridges(dungeonSize, roomsList, bridgesList, maxBridgeWidth,
+                           rng)
+            for bounds in bridge]
+
+def _repairBridges (dungeonSize, roomsList, bridgesList, maxBridgeWidth=1,
+                    rng=None):
+    """
+        Works out repairConnectivity's bridges. Returns a list of
+         (roomIndex, mainRoomIndex, bridge rects), one per joined component.
+    """
+    floorGraph = _FloorGraph(dungeonSize, len(roomsList))
+    roomRects = [floorGraph.addRoom(bounds) for bounds in roomsList]
+    for bounds in bridgesList:
+        floorGraph.addBridge(bounds)
+    components, unreachableRooms = _roomComponents(floorGraph, roomRects)
+    joins = []
+    if not unreachableRooms:
+        return joins
+
+    # Closest rooms are looked up in a grid holding only the main component:
+    mainGrid = _RoomCenterGrid(roomsList)
+    for componentRooms in components[1:]:
+        for roomIndex in componentRooms:
+            mainGrid.remove(roomIndex)
+    for componentRooms in components[1:]:
+        # Rooms with no floor at all can't be connected:
+        componentRooms = [roomIndex for roomIndex in componentRooms
+                          if roomRects[roomIndex] != None]
+        if not componentRooms:
+            continue
+        roomIndex, mainRoomIndex = _closestRoomPairIn(mainGrid, componentRooms)
+        bridge = generateBridge(roomsList[mainRoomIndex], roomsList[roomIndex],
+                                maxBridgeWidth, rng)
+        for bounds in bridge:
+            floorGraph.addBridge(bounds)
+        if floorGraph.find(roomRects[roomIndex]) != \
+                floorGraph.find(roomRects[mainRoomIndex]):
+            bridge.extend(_lCorridor(roomsList[mainRoomIndex],
+                                     roomsList[roomIndex]))
+            for bounds in bridge[-2:]:
+                floorGraph.addBridge(bounds)
+        joins.append((roomIndex, mainRoomIndex, bridge))
+        for roomIndex in componentRooms:
+            mainGrid.add(roomIndex)
+    return joins
+
+def _roomComponents (floorGraph, roomRects):
+    """
+        Groups rooms by the floor component of their first floor rect.
+        Returns (components, unreachableRooms) like checkConnectivity.
+    """
+    components = {}
+    for roomIndex, rectIndex in enumerate(roomRects):
+        # A room without floor tiles is a component of its own:
+        root = floorGraph.find(rectIndex) if rectIndex != None else \
+            ("empty", roomIndex)
+        components.setdefault(root, []).append(roomIndex)
+    components = sorted(components.values(),
+                        key=lambda rooms: (-len(rooms), rooms[0]))
+    unreachableRooms = sorted(roomIndex for rooms in components[1:]
+                              for roomIndex in rooms)
+    return components, unreachableRooms
+
+def _closestRoomPair (roomsList, roomIndices, otherRoomIndices):
+    """
+        Returns the (roomIndex, otherRoomIndex) pair with the closest centers.
+    """
+    closestPair = None
+    closestDistance = None
+    for roomIndex in roomIndices:
+        otherIndex = otherRoomIndices[_closestRoomIndex(
+            roomsList[roomIndex],
+            [roomsList[otherIndex] for otherIndex in otherRoomIndices])]
+        center = _roomCenter(roomsList[roomIndex])
+        otherCenter = _roomCenter(roomsList[otherIndex])
+        dist = ((otherCenter[0] - center[0]) ** 2 +
+                (otherCenter[1] - center[1]) ** 2)
+        if closestPair == None or dist < closestDistance:
+            closestPair = (roomIndex, otherIndex)
+            closestDistance = dist
+    return closestPair
+
+def _closestRoomPairIn (roomGrid, roomIndices):
+    """
+        Returns the (roomIndex, gridRoomIndex) pair with the closest centers
+         between roomIndices and the rooms in a _RoomCenterGrid, picking the
+         same pair as _closestRoomPair.
+    """
+    closestPair = None
+    closestDistance = None
+    for roomIndex in roomIndices:
+        otherIndex = roomGrid.findClosest(roomIndex)
+        center = roomGrid.centers[roomIndex]
+        otherCenter = roomGrid.centers[otherIndex]
+        dist = ((otherCenter[0] - center[0]) ** 2 +
+                (otherCenter[1] - center[1]) ** 2)
+        if closestPair == None or dist < closestDistance:
+            closestPair = (roomIndex, otherIndex)
+            closestDistance = dist
+    return closestPair
+
+def _lCorridor (room1, room2):
+    """
+        Returns two 1 tile wide rects joining the center tiles of two rooms:
+         across from room1's center, then up or down into room2's center.
+    """
+    x1 = (min(room1[0], room1[2]) + max(room1[0], room1[2])) // 2
+    y1 = (min(room1[1], room1[3]) + max(room1[1], room1[3])) // 2
+    x2 = (min(room2[0], room2[2]) + max(room2[0], room2[2])) // 2
+    y2 = (min(room2[1], room2[3]) + max(room2[1], room2[3])) // 2
+    return [(min(x1, x2), y1, max(x1, x2) + 1, y1 + 1),
+            (x2, min(y1, y2), x2 + 1, max(y1, y2) + 1)]
+
+class _FloorGraph ():
+    """
+        Union-find over the in-grid floor rects of a dungeon. Rects are added
+         one at a time and joined with every overlapping or edge-sharing rect
+         found in their grid buckets.
+    """
+    def __init__ (self, dungeonSize, roomCount):
+        self.dungeonSize = tuple(dungeonSize)
+        area = dungeonSize[0] * dungeonSize[1]
+        self.cellSize = max(8, int((area / max(roomCount, 1)) ** 0.5))
+        self.rects = []
+        self.parents = []
+        self.sizes = []
+        self.cells = {}
+
+    def addRoom (self, bounds):
+        """
+            Adds a room's floor. Returns the index of its first floor rect, or
+             None if it has no floor tiles.
+        """
+        rectIndices = [self._addRect(rect) for rect in
+                       _roomFloorRects(self.dungeonSize, bounds)]
+        return rectIndices[0] if rectIndices else None
+
+    def addBridge (self, bounds):
+        for rect in _bridgeFloorRects(self.dungeonSize, bounds):
+            self._addRect(rect)
+
+    def _addRect (self, rect):
+        x0, y0, x1, y1 = rect
+        if x0 >= x1 or y0 >= y1:
+            return None
+        rectIndex = len(self.rects)
+        self.rects.append(rect)
+        self.parents.append(rectIndex)
+        self.sizes.append(1)
+        # Bucket the rect including its right and bottom edges, so rects that
+        #  only touch it share a cell with it:
+        for cell in _cellsOverlapping(self.cellSize, x0, y0, x1 + 1, y1 + 1):
+            cellRects = self.cells.setdefault(cell, [])
+            for otherIndex in cellRects:
+                if _rectsConnect(rect, self.rects[otherIndex]):
+                    self.union(rectIndex, otherIndex)
+            cellRects.append(rectIndex)
+        return rectIndex
+
+    def find (self, rectIndex):
+        parents = self.parents
+        while parents[rectIndex] != rectIndex:
+            parents[rectIndex] = parents[parents[rectIndex]] # Path halving.
+            rectIndex = parents[rectIndex]
+        return rectIndex
+
+    def union (self, rectIndex, otherIndex):
+        root = self.find(rectIndex)
+        otherRoot = self.find(otherIndex)
+        if root == otherRoot:
+            return
+        if self.sizes[root] < self.sizes[otherRoot]:
+            root, otherRoot = otherRoot, root
+        self.parents[otherRoot] = root
+        self.sizes[root] += self.sizes[otherRoot]
+
+def _rectsConnect (rect, other):
+    """
+        Returns True if two end-exclusive rects share a tile or a tile edge.
+    """
+    overlapX = rect[0] < other[2] and other[0] < rect[2]
+    overlapY = rect[1] < other[3] and other[1] < rect[3]
+    touchX = rect[0] <= other[2] and other[0] <= rect[2]
+    touchY = rect[1] <= other[3] and other[1] <= rect[3]
+    return (overlapX and touchY) or (overlapY and touchX)
+# --- ---
+
+# --- Pathfinding ---
+def computeDistanceField (tiles, sources):
+    """
+        Returns a numpy int32 array (needs numpy) with the number of steps from
+         each floor tile to the closest of the sources, a list of (x, y) tiles.
+        Steps go up, down, left and right over floor tiles; walls and
+         unreachable tiles are -1.
+        The breadth first search is vectorized: each step expands the whole
+         frontier at once with flat index arithmetic on a padded grid.
+    """
+    import numpy as np
+    floor = np.asarray(tiles).astype(bool)
+    height, width = floor.shape
+    paddedWidth = width + 2
+    # A border of walls means neighbours never fall off the grid:
+    paddedFloor = np.zeros((height + 2, paddedWidth), dtype=bool)
+    paddedFloor[1:-1, 1:-1] = floor
+    paddedFloor = paddedFloor.ravel()
+    distances = np.full(paddedFloor.size, -1, dtype=np.int32)
+
+    frontier = np.array([(y + 1) * paddedWidth + x + 1 for x, y in sources
+                         if 0 <= x < width and 0 <= y < height],
+                        dtype=np.intp)
+    frontier = np.unique(frontier[paddedFloor[frontier]])
+    distances[frontier] = 0
+    step = 0
+    while frontier.size:
+        step += 1
+        neighbours = np.concatenate((frontier - 1, frontier + 1,
+                                     frontier - paddedWidth,
+                                     frontier + paddedWidth))
+        neighbours = np.unique(neighbours[paddedFloor[neighbours] &
+                                          (distances[neighbours] < 0)])
+        distances[neighbours] = step
+        frontier = neighbours
+    return distances.reshape(height + 2, paddedWidth)[1:-1, 1:-1].copy()
+
+class DungeonPaths ():
+    """
+        Precomputed navigation data for one dungeon, built from its rooms and
+         bridges (no raster needed).
+        Touching bridge rects are merged into corridors with union-find, once.
+         roomGraph is a graph over rooms (nodes 0 to roomCount - 1) and
+         corridors (node roomCount + corridor index): each node maps to
+         {otherNode: length} for the rooms and corridors it touches. Lengths
+         are Manhattan lengths between room centers, and from a room center
+         through the bridge rect it enters a corridor by to the corridor's
+         center. corridors lists the floor rect indices of each corridor.
+        Node to node distances are computed with Dijkstra from a node the first
+         time they are needed and cached, so path queries become a graph lookup
+         plus short tile searches around the rooms and corridors on the way.
+    """
+    def __init__ (self, dungeonSize, roomsList, bridgesList):
+        self.dungeonSize = tuple(dungeonSize)
+        self.roomsList = list(roomsList)
+        self.query = DungeonQuery(dungeonSize, roomsList, bridgesList)
+        self._distanceRows = {} # node -> (distances, previous nodes)
+        self.roomGraph = {}
+        self.corridors = [] # corridor index -> list of floor rect indices
+        self._rectCorridors = {} # bridge floor rect index -> corridor index
+        self._roomRects = [[] for room in self.roomsList]
+        # (room, corridorNode) -> index of the bridge rect the room enters by:
+        self._entrances = {}
+        self._buildRoomGraph()
+
+    def _buildRoomGraph (self):
+        floorRects = self.query.floorRects
+        roomCount = len(self.roomsList)
+        # Merge touching bridge rects into corridors:
+        corridorSets = _FloorGraph(self.dungeonSize, roomCount)
+        bridgeRects = [rectIndex for rectIndex, rect in enumerate(floorRects)
+                       if rect[4] == -1]
+        setIndices = [corridorSets._addRect(floorRects[rectIndex][:4])
+                      for rectIndex in bridgeRects]
+        corridorIndices = {} # union-find root -> corridor index
+        for rectIndex, setIndex in zip(bridgeRects, setIndices):
+            root = corridorSets.find(setIndex)
+            if root not in corridorIndices:
+                corridorIndices[root] = len(self.corridors)
+                self.corridors.append([])
+            self.corridors[corridorIndices[root]].append(rectIndex)
+            self._rectCorridors[rectIndex] = corridorIndices[root]
+        corridorCenters = []
+        for corridorRects in self.corridors:
+            rects = [floorRects[rectIndex] for rectIndex in corridorRects]
+            corridorCenters.append(((min(rect[0] for rect in rects) +
+                                     max(rect[2] for rect in rects)) // 2,
+                                    (min(rect[1] for rect in rects) +
+                                     max(rect[3] for rect in rects)) // 2))
+
+        self.roomGraph = dict((node, {}) for node in
+                              range(roomCount + len(self.corridors)))
+        # Link every room to the rooms and corridors its floor touches:
+        for rectIndex, rect in enumerate(floorRects):
+            roomIndex = rect[4]
+            if roomIndex == -1:
+                continue
+            self._roomRects[roomIndex].append(rectIndex)
+            midpoint = _roomMidpoint(self.roomsList[roomIndex])
+            for otherIndex in self._touchingRects(rectIndex):
+                otherRoom = floorRects[otherIndex][4]
+                if otherRoom == -1:
+                    corridor = self._rectCorridors[otherIndex]
+                    x0, y0, x1, y1 = floorRects[otherIndex][:4]
+                    entrance = ((x0 + x1) // 2, (y0 + y1) // 2)
+                    if self._link(roomIndex, roomCount + corridor,
+                                  _manhattan(midpoint, entrance) +
+                                  _manhattan(entrance,
+                                             corridorCenters[corridor])):
+                        self._entrances[(roomIndex, roomCount + corridor)] = \
+                            otherIndex
+                elif otherRoom != roomIndex:
+                    self._link(roomIndex, otherRoom, _manhattan(
+                        midpoint, _roomMidpoint(self.roomsList[otherRoom])))
+
+    def _link (self, node, otherNode, length):
+        """
+            Adds an edge between two nodes, or shortens it. Returns True if the
+             edge changed.
+        """
+        if otherNode in self.roomGraph[node] and \
+                self.roomGraph[node][otherNode] <= length:
+            return False
+        self.roomGraph[node][otherNode] = length
+        self.roomGraph[otherNode][node] = length
+        return True
+
+    def _touchingRects (self, rectIndex):
+        """
+            Returns the indices of the floor rects sharing a tile or a tile
+             edge with a floor rect.
+        """
+        floorRects = self.query.floorRects
+        rect = floorRects[rectIndex]
+        touching = set()
+        # One tile past every edge, so rects touching across a cell boundary
+        #  are found too:
+        for cell in _cellsOverlapping(self.query.cellSize, rect[0] - 1,
+                                      rect[1] - 1, rect[2] + 1, rect[3] + 1):
+            for otherIndex in self.query.cells.get(cell, ()):
+                if otherIndex != rectIndex and \
+                        _rectsConnect(rect, floorRects[otherIndex]):
+                    touching.add(otherIndex)
+        return touching
+
+    def _corridorChain (self, rectIndex, otherIndex):
+        """
+            Returns the bridge rect indices on a shortest chain of touching
+             rects between two rects of the same corridor.
+        """
+        previous = {rectIndex: None}
+        queue = [rectIndex]
+        for currentIndex in queue:
+            if currentIndex == otherIndex:
+                break
+            for nextIndex in self._touchingRects(currentIndex):
+                if nextIndex not in previous and \
+                        self.query.floorRects[nextIndex][4] == -1:
+                    previous[nextIndex] = currentIndex
+                    queue.append(nextIndex)
+        chain = [otherIndex]
+        while previous[chain[-1]] != None:
+            chain.append(previous[chain[-1]])
+        chain.reverse()
+        return chain
+
+    def _nodeAt (self, tile):
+        """
+            Returns (node, rectIndex) for a floor tile: its room, or else its
+             corridor and the bridge rect it is in. Returns (None, None) for
+             walls.
+        """
+        roomIndex = self.query.roomAt(*tile)
+        if roomIndex != None:
+            return roomIndex, None
+        cell = (tile[0] // self.query.cellSize, tile[1] // self.query.cellSize)
+        for rectIndex in self.query.cells.get(cell, ()):
+            if rectIndex in self._rectCorridors and \
+                    _inRect(tile, self.query.floorRects[rectIndex]):
+                return (len(self.roomsList) + self._rectCorridors[rectIndex],
+                        rectIndex)
+        return None, None
+
+    def _distanceRow (self, node):
+        """
+            Returns (distances, previousNodes) from a node to every node,
+             running Dijkstra the first time.
+        """
+        if node in self._distanceRows:
+            return self._distanceRows[node]
+        import heapq
+        distances = {node: 0}
+        previousNodes = {node: None}
+        heap = [(0, node)]
+        while heap:
+            distance, currentNode = heapq.heappop(heap)
+            if distance > distances[currentNode]:
+                continue
+            for otherNode, length in self.roomGraph[currentNode].items():
+                if otherNode not in distances or \
+                        distance + length < distances[otherNode]:
+                    distances[otherNode] = distance + length
+                    previousNodes[otherNode] = currentNode
+                    heapq.heappush(heap, (distance + length, otherNode))
+        self._distanceRows[node] = (distances, previousNodes)
+        return distances, previousNodes
+
+    def _nodePath (self, node, otherNode):
+        distances, previousNodes = self._distanceRow(node)
+        if otherNode not in distances:
+            return None
+        nodes = [otherNode]
+        while nodes[-1] != node:
+            nodes.append(previousNodes[nodes[-1]])
+        nodes.reverse()
+        return nodes
+
+    def roomDistance (self, roomIndex, otherRoom):
+        """
+            Returns the corridor distance between two rooms, or None if they
+             are not connected.
+        """
+        return self._distanceRow(roomIndex)[0].get(otherRoom)
+
+    def allRoomDistances (self):
+        """
+            Computes and caches every room to room distance. Returns a list of
+             lists, None where rooms are not connected.
+        """
+        roomCount = len(self.roomsList)
+        return [[self._distanceRow(roomIndex)[0].get(otherRoom)
+                 for otherRoom in range(roomCount)]
+                for roomIndex in range(roomCount)]
+
+    def roomPath (self, roomIndex, otherRoom):
+        """
+            Returns the rooms on the shortest corridor route between two rooms
+             (both included), or None if they are not connected.
+        """
+        nodes = self._nodePath(roomIndex, otherRoom)
+        if nodes == None:
+            return None
+        return [node for node in nodes if node < len(self.roomsList)]
+
+    def findPath (self, start, goal):
+        """
+            Returns a list of (x, y) tiles leading from start to goal over floor
+             tiles, or None if there is no path (or either tile is a wall).
+            The route is looked up in the room graph, starting and ending at
+             the room or corridor of each tile, and only the tiles around each
+             room and corridor on it are searched.
+        """
+        floorRects = self.query.floorRects
+        roomCount = len(self.roomsList)
+        startNode, startRect = self._nodeAt(start)
+        goalNode, goalRect = self._nodeAt(goal)
+        if startNode == None or goalNode == None:
+            return None
+        nodes = self._nodePath(startNode, goalNode)
+        if nodes == None:
+            return None
+        path = [start]
+        for step, node in enumerate(nodes):
+            nextNode = nodes[step + 1] if step + 1 < len(nodes) else None
+            if node >= roomCount:
+                # Through the chain of bridge rects to the next room or goal:
+                entranceRect = startRect if step == 0 else \
+                    self._entrances[(nodes[step - 1], node)]
+                exitRect = goalRect if nextNode == None else \
+                    self._entrances[(nextNode, node)]
+                windowRects = self._corridorChain(entranceRect, exitRect)
+            elif nextNode == None:
+                break
+            elif nextNode >= roomCount:
+                # Into the bridge rect that enters the next corridor:
+                windowRects = self._roomRects[node] + \
+                    [self._entrances[(node, nextNode)]]
+            else:
+                windowRects = list(self._roomRects[node])
+            if nextNode == None:
+                isGoal = lambda tile: tile == goal
+            elif nextNode >= roomCount:
+                entrance = floorRects[self._entrances[(node, nextNode)]]
+                isGoal = lambda tile: _inRect(tile, entrance)
+            else:
+                windowRects = windowRects + self._roomRects[nextNode]
+                nextRoomBounds = self.roomsList[nextNode]
+                isGoal = lambda tile: _inRect(tile, nextRoomBounds)
+            window = [floorRects[rectIndex] for rectIndex in windowRects]
+            leg = _bfsPath(self.query.isFloor, path[-1], isGoal,
+                           (min(rect[0] for rect in window),
+                            min(rect[1] for rect in window),
+                            max(rect[2] for rect in window),
+                            max(rect[3] for rect in window)))
+            if leg == None:
+                # The pieces of a room wrapped around the grid edge may only
+                #  connect outside the window:
+                leg = _bfsPath(self.query.isFloor, path[-1], isGoal,
+                               (0, 0) + self.dungeonSize)
+            path.extend(leg[1:])
+        if goalNode >= roomCount:
+            return path
+        # Rooms are solid floor, so the last stretch is a straight L:
+        x, y = path[-1]
+        stepX = 1 if goal[0] > x else -1
+        path.extend((pathX, y) for pathX in range(x + stepX, goal[0] + stepX,
+                                                  stepX))
+        stepY = 1 if goal[1] > y else -1
+        path.extend((goal[0], pathY) for pathY in range(y + stepY,
+                                                        goal[1] + stepY, stepY))
+        return path
+
+def _manhattan (point, otherPoint):
+    return abs(otherPoint[0] - point[0]) + abs(otherPoint[1] - point[1])
+
+def _roomMidpoint (room):
+    """
+        Returns the center tile of a room (unlike _roomCenter, which keeps
+         findClosestRoom's measure).
+    """
+    return ((min(room[0], room[2]) + max(room[0], room[2])) // 2,
+            (min(room[1], room[3]) + max(room[1], room[3])) // 2)
+
+def _inRect (tile, rect):
+    return (min(rect[0], rect[2]) <= tile[0] < max(rect[0], rect[2]) and
+            min(rect[1], rect[3]) <= tile[1] < max(rect[1], rect[3]))
+
+def _bfsPath (isFloor, start, isGoal, window):
+    """
+        Breadth first search over floor tiles inside window (x0, y0, x1, y1).
+        Returns the list of tiles from start to the first goal tile found, or
+         None if no goal tile can be reached.
+    """
+    x0, y0, x1, y1 = window
+    previous = {start: None}
+    queue = [start]
+    for tile in queue:
+        if isGoal(tile):
+            path = [tile]
+            while previous[path[-1]] != None:
+                path.append(previous[path[-1]])
+            path.reverse()
+            return path
+        x, y = tile
+        for neighbour in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if neighbour not in previous and x0 <= neighbour[0] < x1 and \
+                    y0 <= neighbour[1] < y1 and isFloor(*neighbour):
+                previous[neighbour] = tile
+                queue.append(neighbour)
+    return None
+# --- ---
+
+# --- Dungeon Files ---
+# File layout (little-endian): a header, then the partition, room and bridge
+#  tables as int32 (x0, y0, x1, y1) rows, then the optional PackedDungeon tiles.
+_DUNGEON_FILE_MAGIC = b"PYBSPDG\0"
+_DUNGEON_FILE_VERSION = 2
+# Version 2 took the last 3 padding bytes of version 1 for bridging, batchRooms
+#  and ensureConnected, which version 1 files read as the defaults, and made the
+#  seed signed (version 1 stored it unsigned):
+_DUNGEON_FILE_HEADER = "<8sHHIIIIddIqIIIBBBx"
+_DUNGEON_FILE_BRIDGING = ("closest", "tree")
+_HAS_TILES = 1
+_HAS_SEED = 2
+
+def saveDungeon (path, dungeonSize, partitionsList, roomsList, bridgesList,
+                 includeTiles=False, **kwargs):
+    """
+        Writes a generated dungeon to path in the compact binary format read by
+         loadDungeon.
+        kwargs are the generation arguments to record in the header:
+         minNodeSize, biasRatio, biasStrength, maxBridgeWidth, bridging,
+         batchRooms, ensureConnected and seed (an int from -2**63 to 2**63-1),
+         with generateDungeon2DList's defaults.
+        With includeTiles=True the rasterized tiles are stored too, at 1 bit
+         per tile.
+    """
+    import struct
+    import sys
+    from array import array
+
+    minNodeSize = kwargs["minNodeSize"] if "minNodeSize" in kwargs else (20, 20)
+    biasRatio = kwargs["biasRatio"] if "biasRatio" in kwargs else 0.75
+    biasStrength = kwargs["biasStrength"] if "biasStrength" in kwargs else 0
+    maxBridgeWidth = kwargs["maxBridgeWidth"] if "maxBridgeWidth" in kwargs else 1
+    bridging = kwargs["bridging"] if "bridging" in kwargs else "closest"
+    batchRooms = kwargs["batchRooms"] if "batchRooms" in kwargs else False
+    ensureConnected = kwargs["ensureConnected"] if "ensureConnected" in kwargs else False
+    seed = kwargs["seed"] if "seed" in kwargs else None
+    if bridging not in _DUNGEON_FILE_BRIDGING:
+        raise ValueError("Unknown bridging %r" % (bridging,))
+    if seed != None and not -2 ** 63 <= seed < 2 ** 63:
+        raise ValueError("seed must be from -2**63 to 2**63-1, got %d" %
+                         (seed,))
+
+    flags = (_HAS_TILES if includeTiles else 0) | \
+            (_HAS_SEED if seed != None else 0)
+    header = struct.pack(_DUNGEON_FILE_HEADER, _DUNGEON_FILE_MAGIC,
+                         _DUNGEON_FILE_VERSION, flags, dungeonSize[0],
+                         dungeonSize[1], minNodeSize[0], minNodeSize[1],
+                         biasRatio, biasStrength, maxBridgeWidth,
+                         seed if seed != None else 0, len(partitionsList),
+                         len(roomsList), len(bridgesList),
+                         _DUNGEON_FILE_BRIDGING.index(bridging),
+                         bool(batchRooms), bool(ensureConnected))
+    with open(path, "wb") as dungeonFile:
+        dungeonFile.write(header)
+        for rectList in (partitionsList, roomsList, bridgesList):
+            rectTable = array("i")
+            for rect in rectList:
+                rectTable.extend(rect)
+            if sys.byteorder == "big":
+                rectTable.byteswap()
+            dungeonFile.write(rectTable.tobytes())
+        if includeTiles:
+            dungeonFile.write(rasterizeDungeon(dungeonSize, roomsList,
+                                               bridgesList, "packed").data)
+
+def loadDungeon (path):
+    """
+        Opens a dungeon written by saveDungeon and returns it as a DungeonFile.
+        The file is memory-mapped: its rect tables and tiles are views into the
+         file, so only the parts you read are loaded.
+    """
+    return DungeonFile(path)
+
+class DungeonFile ():
+    """
+        A memory-mapped dungeon file, see saveDungeon and loadDungeon.
+        Has dungeonSize, the generation arguments (minNodeSize, biasRatio,
+         biasStrength, maxBridgeWidth, bridging, batchRooms, ensureConnected,
+         seed, or None if no seed was stored),
+         partitionsList, roomsList and bridgesList as RectTables, and tiles as
+         a PackedDungeon (or None if the tiles were not stored).
+        Close it (or use it in a with block) to unmap the file.
+    """
+    def __init__ (self, path):
+        import mmap
+        import struct
+
+        with open(path, "rb") as dungeonFile:
+            self._fileMap = mmap.mmap(dungeonFile.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+        self._view = memoryview(self._fileMap)
+        headerSize = struct.calcsize(_DUNGEON_FILE_HEADER)
+        if self._view[:len(_DUNGEON_FILE_MAGIC)] != _DUNGEON_FILE_MAGIC or \
+                len(self._view) < headerSize:
+            self._view.release()
+            self._fileMap.close()
+            raise ValueError("%s is not a dungeon file" % (path,))
+        (magic, version, flags, width, height, minNodeWidth, minNodeHeight,
+         self.biasRatio, self.biasStrength, self.maxBridgeWidth, seed,
+         partitionCount, roomCount, bridgeCount, bridging, batchRooms,
+         ensureConnected) = struct.unpack(_DUNGEON_FILE_HEADER,
+                                          self._view[:headerSize])
+        if not 1 <= version <= _DUNGEON_FILE_VERSION:
+            self._view.release()
+            self._fileMap.close()
+            raise ValueError("%s is a version %d dungeon file, expected %d" %
+                             (path, version, _DUNGEON_FILE_VERSION))
+        if bridging >= len(_DUNGEON_FILE_BRIDGING):
+            self._view.release()
+            self._fileMap.close()
+            raise ValueError("%s has an unknown bridging %d" % (path, bridging))
+        self.dungeonSize = (width, height)
+        self.minNodeSize = (minNodeWidth, minNodeHeight)
+        if version == 1 and seed < 0:
+            seed += 2 ** 64
+        self.seed = seed if flags & _HAS_SEED else None
+        self.bridging = _DUNGEON_FILE_BRIDGING[bridging]
+        self.batchRooms = bool(batchRooms)
+        self.ensureConnected = bool(ensureConnected)
+
+        offset = headerSize
+        rectTables = []
+        for rectCount in (partitionCount, roomCount, bridgeCount):
+            rectTables.append(RectTable(self._view[offset:offset +
+                                                   rectCount * 16]))
+            offset += rectCount * 16
+        self.partitionsList, self.roomsList, self.bridgesList = rectTables
+        self.tiles = None
+        if flags & _HAS_TILES:
+            self.tiles = PackedDungeon(self.dungeonSize, self._view[offset:
+                offset + (width + 7) // 8 * height])
+
+    def close (self):
+        """
+            Unmaps the file. Views taken from this DungeonFile become invalid.
+        """
+        for rectTable in (self.partitionsList, self.roomsList,
+                          self.bridgesList):
+            rectTable.view.release()
+        if self.tiles != None:
+            self.tiles.data.release()
+        self._view.release()
+        self._fileMap.close()
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, *excInfo):
+        self.close()
+
+class RectTable ():
+    """
+        A read-only sequence of (x0, y0, x1, y1) rects over a buffer of int32
+         values, without copying it. view is the flat int32 memoryview, e.g.
+         for numpy.frombuffer(table.view, dtype="<i4").reshape(-1, 4).
+    """
+    __slots__ = ("view",)
+
+    def __init__ (self, buffer):
+        import sys
+        if sys.byteorder == "big":
+            # Stored little-endian; big-endian hosts need a swapped copy:
+            from array import array
+            swapped = array("i", bytes(buffer))
+            swapped.byteswap()
+            buffer = swapped
+        self.view = memoryview(buffer).cast("B").cast("i")
+
+    def __len__ (self):
+        return len(self.view) // 4
+
+    def __getitem__ (self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("RectTable index out of range")
+        return tuple(self.view[index * 4:index * 4 + 4])
+
+    def __iter__ (self):
+        view = self.view
+        for start in range(0, len(view), 4):
+            yield tuple(view[start:start + 4])
+
+    def tolist (self):
+        """
+            Returns the rects as a list of tuples.
+        """
+        flat = self.view.tolist()
+        return list(zip(flat[0::4], flat[1::4], flat[2::4], flat[3::4]))
+# --- ---
+
+# --- Batch Generation ---
+def generateDungeonBatch (paramsIter, workers=None, chunksize=16, stats=None):
+    """
+        Generates many dungeons on a pool of worker processes.
+        paramsIter yields one dict of generateDungeon2DList arguments per
+         dungeon, e.g. {"dungeonSize": (100, 100), "seed": 7}. Give each item a
+         seed to make the batch reproducible.
+        Yields a PackedDungeon per item, in the order of paramsIter. Only
+         2 * workers chunks of chunksize items are in flight at once, so memory
+         stays bounded for any number of items.
+        workers defaults to the CPU count; workers=0 generates in this process.
+        If stats is a dict, it is filled with per-worker throughput keyed by
+         worker process id: {"dungeons": ..., "tiles": ..., "seconds": ...}.
+    """
+    import os
+    workers = workers if workers != None else os.cpu_count()
+    for packedDungeons, workerStats in _mapChunks(_generatePackedChunk,
+                                                  _chunked(paramsIter,
+                                                           chunksize),
+                                                  workers):
+        _addWorkerStats(stats, workerStats)
+        yield from packedDungeons
+
+def _chunked (items, chunksize):
+    """
+        Yields lists of up to chunksize items from an iterable.
+    """
+    import itertools
+    items = iter(items)
+    return iter(lambda: list(itertools.islice(items, chunksize)), [])
+
+def _mapChunks (function, chunks, workers):
+    """
+        Yields function(chunk) for each chunk, in order, computed on a pool of
+         worker processes (or in this process if workers is 0). Only
+         2 * workers chunks are in flight at once.
+    """
+    if workers == 0:
+        for chunk in chunks:
+            yield function(chunk)
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        try:
+            for chunk in chunks:
+                pending.append(pool.submit(function, chunk))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Don't generate what nobody will read if we are closed early:
+            for future in pending:
+                future.cancel()
+
+def _generatePackedChunk (paramsChunk):
+    """
+        Worker side of generateDungeonBatch: generates and packs a chunk of
+         dungeons. Returns (packedDungeons, (pid, dungeons, tiles, seconds)).
+    """
+    import os
+    import time
+
+    startTime = time.perf_counter()
+    packedDungeons = []
+    tiles = 0
+    for params in paramsChunk:
+        params = dict(params)
+        dungeonSize = params.pop("dungeonSize", (100, 100))
+        minNodeSize = params.pop("minNodeSize", (20, 20))
+        dungeonTree, roomsList, bridgesList = generateDungeonRects(dungeonSize,
+                                                                   minNodeSize,
+                                                                   **params)
+        packedDungeons.append(rasterizeDungeon(dungeonSize, roomsList,
+                                               bridgesList, "packed"))
+        tiles += dungeonSize[0] * dungeonSize[1]
+    seconds = time.perf_counter() - startTime
+    return packedDungeons, (os.getpid(), len(paramsChunk), tiles, seconds)
+
+def _addWorkerStats (stats, workerStats):
+    if stats == None:
+        return
+    pid, dungeons, tiles, seconds = workerStats
+    if pid not in stats:
+        stats[pid] = {"dungeons": 0, "tiles": 0, "seconds": 0.0}
+    stats[pid]["dungeons"] += dungeons
+    stats[pid]["tiles"] += tiles
+    stats[pid]["seconds"] += seconds
+# --- ---
+
+# --- Parallel Generation ---
+def generateDungeonParallel (dungeonSize = (100, 100), minNodeSize = (20, 20),
+                             **kwargs):
+    """
+        Generates one large dungeon on several worker processes and returns its
+         tiles like generateDungeon2DList (output="list", "numpy" or "packed").
+        The top splitDepth levels of the tree (4 by default) are split here;
+         each remaining subtree is grown, given rooms, bridged and rasterized by
+         a worker straight into a shared memory grid. Then the subtrees are
+         joined by one bridge per top level split, between the closest rooms on
+         either side of it (or with bridging="tree", between the rooms facing
+         each other across it, see _bridgeSiblings).
+        Every subtree gets its own seed drawn from seed=/rng= in order, so the
+         same arguments give the same dungeon for any number of workers (but
+         not the same dungeon generateDungeon2DList gives).
+        Also takes biasRatio, biasStrength, maxBridgeWidth, bridging and
+         ensureConnected.
+        workers defaults to the CPU count; workers=0 generates in this process.
+    """
+    output = kwargs["output"] if "output" in kwargs else "list"
+    workers = kwargs["workers"] if "workers" in kwargs else None
+    splitDepth = kwargs["splitDepth"] if "splitDepth" in kwargs else 4
     biasRatio = kwargs["biasRatio"] if "biasRatio" in kwargs else 0.75
     biasStrength = kwargs["biasStrength"] if "biasStrength" in kwargs else 0
     maxBridgeWidth = kwargs["maxBridgeWidth"] if "maxBridgeWidth" in kwargs else 1
+    bridging = kwargs["bridging"] if "bridging" in kwargs else "closest"
+    ensureConnected = kwargs["ensureConnected"] if "ensureConnected" in kwargs else False
+    if output not in ("list", "numpy", "packed"):
+        raise ValueError("Unknown dungeon output %r" % (output,))
+    if bridging not in ("closest", "tree"):
+        raise ValueError("Unknown bridging %r" % (bridging,))
+    rng = _createRng(kwargs)
 
-    # Create dungeon tree with partitions:
-    dungeonTree = TreeNode((0,0), dungeonSize, minNodeSize)
-    partitions = dungeonTree.getPartitionsList()
+    # Split the top levels, keeping the tree as nested
+    #  (before, after, isVerticalSplit) tuples with subtree indices at the
+    #  leaves:
+    subtrees = []
+    def splitTop (origin, bounds, iteration):
+        split = None
+        if iteration < splitDepth:
+            split = _splitPartition(origin, bounds, minNodeSize, rng)
+        if split == None:
+            subtrees.append((origin, bounds, iteration,
+                             rng.getrandbits(63)))
+            return len(subtrees) - 1
+        (beforeOrigin, beforeBounds), (afterOrigin, afterBounds) = split
+        return (splitTop(beforeOrigin, beforeBounds, iteration + 1),
+                splitTop(afterOrigin, afterBounds, iteration + 1),
+                afterOrigin[0] != origin[0])
+    topTree = splitTop((0, 0), tuple(dungeonSize), 0)
 
-    # Create rooms within the given partitions:
-    # Convert from tree to slices list:
-    dungeonTree.generateTreeRooms(biasRatio, biasStrength)
-    roomsList = dungeonTree.getRoomsList()
-    # Generate bridges between this tree's rooms:
-    bridgesList = generateTreeBridges(roomsList, maxBridgeWidth)
-    dungeon2D = [[0 for i in range(dungeonSize[0])] for j in range(dungeonSize[1])]
-    # In our 2D grid, rooms and bridges will count as floor:
-    # Go through each tile in each List and fill in dungeon2D's floor:
-    for bounds in roomsList:
-        x0 = min(bounds[0], bounds[2])
-        y0 = min(bounds[1], bounds[3])
-        x1 = max(bounds[0], bounds[2])
-        y1 = max(bounds[1], bounds[3])
-        for rowNum in range(y0, y1):
-            for colNum in range(x0, x1):
-                dungeon2D[rowNum][colNum] = 1
+    tasks = [(tuple(dungeonSize), origin, bounds, iteration, minNodeSize,
+              seed, biasRatio, biasStrength, maxBridgeWidth, bridging)
+             for origin, bounds, iteration, seed in subtrees]
+    gridBytes = dungeonSize[0] * dungeonSize[1]
+    if workers == 0:
+        grid = bytearray(gridBytes)
+        results = [_generateSubtree(task, grid) for task in tasks]
+        return _finishParallelDungeon(dungeonSize, grid, topTree, results,
+                                      maxBridgeWidth, bridging, ensureConnected,
+                                      rng, output)
 
-    for bounds in bridgesList:
-        x0 = min(bounds[0], bounds[2])
-        y0 = min(bounds[1], bounds[3])
-        x1 = max(bounds[0], bounds[2])
-        y1 = max(bounds[1], bounds[3])
-
-        # Account for width=0 bridges
-        if (x1 - x0 == 0 and x1 + 1 < dungeonSize[0]):
-            x1 += 1
-        elif (x1 - x0 == 0 and x0 - 1 >= 0):
-            x0 -= 1
-
-        if (y1 - y0 == 0 and y1 + 1 < dungeonSize[1]):
-            y1 += 1
-        elif (y1 - y0 == 0 and y0 - 1 >= 0):
-            y0 -= 1
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+    workers = workers if workers != None else os.cpu_count()
+    sharedGrid = shared_memory.SharedMemory(create=True,
+                                            size=max(gridBytes, 1))
+    try:
+        # Fresh shared memory is zeroed, so workers only write floor tiles:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_generateSubtree, tasks,
+                                    [sharedGrid.name] * len(tasks)))
+        return _finishParallelDungeon(dungeonSize, sharedGrid.buf, topTree,
+                                      results, maxBridgeWidth, bridging,
+                                      ensureConnected, rng, output)
+    finally:
+        sharedGrid.close()
+        sharedGrid.unlink()
 
-        for rowNum in range(y0, y1):
-            for colNum in range(x0, x1):
-                dungeon2D[rowNum][colNum] = 1
-    return dungeon2D
+def _generateSubtree (task, grid):
+    """
+        Worker side of generateDungeonParallel: grows one subtree, places its
+         rooms and bridges and writes their floor tiles into grid (a writable
+         buffer, or the name of the shared memory holding it), one byte per
+         tile. Returns (roomsList, bridgesList, the subtree's extreme rooms with
+         tree bridging or else None).
+    """
+    (dungeonSize, origin, bounds, iteration, minNodeSize, seed, biasRatio,
+     biasStrength, maxBridgeWidth, bridging) = task
+    rng = random.Random(seed)
+    subtree = TreeNode(origin, bounds, minNodeSize, iteration, rng)
+    subtree.generateTreeRooms(biasRatio, biasStrength, rng)
+    roomsList = subtree.getRoomsList()
+    extremes = None
+    if bridging == "tree":
+        extremes = subtree._bridgeSubtrees(dungeonSize, maxBridgeWidth, rng)
+        bridgesList = subtree.getRoomBridges()
+    else:
+        bridgesList = generateTreeBridges(roomsList, maxBridgeWidth, rng)
+    floorRects = _floorRects(dungeonSize, roomsList, bridgesList)
+    if not isinstance(grid, str):
+        _fillGrid(grid, dungeonSize[0], floorRects)
+        return roomsList, bridgesList, extremes
+
+    from multiprocessing import shared_memory
+    sharedGrid = shared_memory.SharedMemory(grid)
+    try:
+        _fillGrid(sharedGrid.buf, dungeonSize[0], floorRects)
+    finally:
+        sharedGrid.close()
+    return roomsList, bridgesList, extremes
+
+def _fillGrid (grid, width, floorRects):
+    """
+        Sets the tiles of in-grid floor rects to 1 in a one byte per tile grid.
+        Tiles are only ever set, so workers filling overlapping rects at the
+         same time still agree.
+    """
+    for x0, y0, x1, y1 in floorRects:
+        floorRow = b"\x01" * (x1 - x0)
+        for rowStart in range(y0 * width, y1 * width, width):
+            grid[rowStart + x0:rowStart + x1] = floorRow
+
+def _finishParallelDungeon (dungeonSize, grid, topTree, results,
+                            maxBridgeWidth, bridging, ensureConnected, rng,
+                            output):
+    """
+        Bridges the subtrees of generateDungeonParallel together in grid and
+         returns it in the requested output form.
+    """
+    roomsList = []
+    bridgesList = []
+    subtreeRooms = []
+    for subtreeRoomsList, subtreeBridgesList, extremes in results:
+        subtreeRooms.append(list(range(len(roomsList),
+                                       len(roomsList) + len(subtreeRoomsList))))
+        roomsList.extend(subtreeRoomsList)
+        bridgesList.extend(subtreeBridgesList)
+
+    def bridgeTop (node):
+        """
+            Bridges the two sides of every top level split, bottom up.
+            Returns the room indices of node.
+        """
+        if not isinstance(node, tuple):
+            return subtreeRooms[node]
+        beforeRooms = bridgeTop(node[0])
+        afterRooms = bridgeTop(node[1])
+        if beforeRooms and afterRooms:
+            # Only rooms near the split are worth comparing:
+            roomIndex, otherIndex = _closestRoomPair(
+                roomsList, _roomsNearest(roomsList, beforeRooms, afterRooms),
+                _roomsNearest(roomsList, afterRooms, beforeRooms))
+            newBridges.extend(generateBridge(roomsList[roomIndex],
+                                             roomsList[otherIndex],
+                                             maxBridgeWidth, rng))
+        return beforeRooms + afterRooms
+
+    def bridgeTopTree (node):
+        """
+            Joins the two sides of every top level split like
+             generateTreeBridges does. Returns the extreme rooms of node.
+        """
+        if not isinstance(node, tuple):
+            return results[node][2]
+        bridges, extremes = _bridgeSiblings(dungeonSize, bridgeTopTree(node[0]),
+                                            bridgeTopTree(node[1]), node[2],
+                                            maxBridgeWidth, rng)
+        newBridges.extend(bridges)
+        return extremes
+
+    newBridges = []
+    if bridging == "tree":
+        bridgeTopTree(topTree)
+    else:
+        bridgeTop(topTree)
+    if ensureConnected:
+        newBridges.extend(repairConnectivity(dungeonSize, roomsList,
+                                             bridgesList + newBridges,
+                                             maxBridgeWidth, rng))
+    _fillGrid(grid, dungeonSize[0], _floorRects(dungeonSize, [], newBridges))
+    return _gridOutput(dungeonSize, grid, output)
+
+def _roomsNearest (roomsList, roomIndices, otherRoomIndices, count=16):
+    """
+        Returns the count rooms of roomIndices whose centers are nearest to the
+         bounding box of the centers of otherRoomIndices.
+    """
+    import heapq
+    otherCenters = [_roomCenter(roomsList[otherIndex])
+                    for otherIndex in otherRoomIndices]
+    x0 = min(center[0] for center in otherCenters)
+    y0 = min(center[1] for center in otherCenters)
+    x1 = max(center[0] for center in otherCenters)
+    y1 = max(center[1] for center in otherCenters)
+    def boxDistance (roomIndex):
+        x, y = _roomCenter(roomsList[roomIndex])
+        dx = max(x0 - x, 0, x - x1)
+        dy = max(y0 - y, 0, y - y1)
+        return dx * dx + dy * dy
+    return heapq.nsmallest(count, roomIndices, key=boxDistance)
+
+# Maps one byte per tile rows to the binary digits of their bit masks:
+_BIT_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+
+def _gridOutput (dungeonSize, grid, output):
+    """
+        Converts a one byte per tile grid to a rasterizeDungeon output form.
+    """
+    width, height = dungeonSize
+    if output == "numpy":
+        import numpy as np
+        return np.frombuffer(grid, dtype=np.uint8,
+                             count=width * height).reshape(height,
+                                                           width).copy()
+    elif output == "packed":
+        rowBytes = (width + 7) // 8
+        padding = b"0" * (rowBytes * 8 - width)
+        return PackedDungeon(dungeonSize, bytearray().join(
+            int(bytes(grid[rowStart:rowStart + width]).translate(_BIT_DIGITS) +
+                padding, 2).to_bytes(rowBytes, "big")
+            for rowStart in range(0, width * height, width)))
+    return [list(grid[rowStart:rowStart + width])
+            for rowStart in range(0, width * height, width)]
+# --- ---
 
 def generateDungeonVisualizeTiles (dungeonSize = (100, 100),
                                    minNodeSize = (20, 20), **kwargs):
@@ -66,6 +2227,7 @@ def generateDungeonVisualizeTiles (dungeonSize = (100, 100),
     biasRatio = kwargs["biasRatio"] if "biasRatio" in kwargs else 0.75
     biasStrength = kwargs["biasStrength"] if "biasStrength" in kwargs else 0
     maxBridgeWidth = kwargs["maxBridgeWidth"] if "maxBridgeWidth" in kwargs else 1
+    bridging = kwargs["bridging"] if "bridging" in kwargs else "closest"
     tileMargin = kwargs["tileMargin"] if "tileMargin" in kwargs else 2
 
     import tkinter as tk
@@ -76,7 +2238,9 @@ def generateDungeonVisualizeTiles (dungeonSize = (100, 100),
     dungeonList = generateDungeon2DList(dungeonSize, minNodeSize,
                                         biasRatio=biasRatio,
                                         biasStrength=biasStrength,
-                                        maxBridgeWidth=maxBridgeWidth)
+                                        maxBridgeWidth=maxBridgeWidth,
+                                        bridging=bridging,
+                                        rng=_createRng(kwargs))
 
     tileWidth = (winWidth) // dungeonSize[0]
     tileHeight = (winWidth) // dungeonSize[1]
@@ -103,18 +2267,21 @@ def generateDungeonVisualize(dungeonSize = (100, 100),
     biasRatio = kwargs["biasRatio"] if "biasRatio" in kwargs else 0.75
     biasStrength = kwargs["biasStrength"] if "biasStrength" in kwargs else 0
     maxBridgeWidth = kwargs["maxBridgeWidth"] if "maxBridgeWidth" in kwargs else 1
+    bridging = kwargs["bridging"] if "bridging" in kwargs else "closest"
 
     import tkinter as tk
     root = tk.Tk()
     canvas = tk.Canvas(root, width=winWidth, height=winHeight)
     canvas.pack()
 
-    dungeonTree = TreeNode((0,0), dungeonSize, minNodeSize)
+    rng = _createRng(kwargs)
+
+    dungeonTree = TreeNode((0,0), dungeonSize, minNodeSize, rng=rng)
     partitions = dungeonTree.getPartitionsList()
     print("Displaying partitions:", partitions, '\n')
     _visualizeDungeonTreePartitions(canvas, dungeonSize, partitions, winWidth,
                                     winHeight)
-    dungeonTree.generateTreeRooms(biasRatio, biasStrength)
+    dungeonTree.generateTreeRooms(biasRatio, biasStrength, rng)
 
     roomsList = dungeonTree.getRoomsList()
     print("Displaying rooms:", roomsList)
@@ -122,7 +2289,11 @@ def generateDungeonVisualize(dungeonSize = (100, 100),
 
     _visualizeDungeonDimensions(canvas, dungeonSize, partitions, roomsList,
                                 winWidth, winWidth)
-    bridgesList = generateTreeBridges(roomsList, maxBridgeWidth)
+    if bridging == "tree":
+        dungeonTree.generateTreeBridges(maxBridgeWidth, rng, dungeonSize)
+        bridgesList = dungeonTree.getRoomBridges()
+    else:
+        bridgesList = generateTreeBridges(roomsList, maxBridgeWidth, rng)
     print("Displaying Bridges: ", bridgesList)
     _visualizeRoomBridges(canvas, dungeonSize, bridgesList, winWidth, winHeight)
     root.mainloop() # Note, Will block until window is closed!
@@ -208,12 +2379,163 @@ def _visualizeRoomBridges (canvas, originalSize, bridgeList, winWidth,
 
 # --- ---
 
+# --- Image Export ---
+# Grey levels used for exported images, close to the Tkinter visualizations:
+_IMAGE_EMPTY = 255
+_IMAGE_FLOOR = 190
+_IMAGE_ROOM = 0
+_IMAGE_PARTITION = 64
+
+def writeDungeonImage (path, tiles, scale=1):
+    """
+        Writes a tile grid (a 2D list, a numpy array or a PackedDungeon) to an
+         image file without any display, in the style of
+         generateDungeonVisualizeTiles: floor is grey, empty space is white.
+        The format follows path's extension: .png, .ppm or .pgm.
+        Each tile becomes a scale by scale pixel block.
+    """
+    toGrey = bytes.maketrans(b"\x00\x01", bytes((_IMAGE_EMPTY, _IMAGE_FLOOR)))
+    if isinstance(tiles, PackedDungeon):
+        width, height = tiles.dungeonSize
+        bitsFormat = "0%db" % (tiles.rowBytes * 8)
+        bitsToGrey = bytes.maketrans(b"01", bytes((_IMAGE_EMPTY,
+                                                   _IMAGE_FLOOR)))
+        def greyRows ():
+            for rowStart in range(0, tiles.rowBytes * height, tiles.rowBytes):
+                rowMask = int.from_bytes(
+                    tiles.data[rowStart:rowStart + tiles.rowBytes], "big")
+                rowBits = format(rowMask, bitsFormat)[:width].encode()
+                yield rowBits.translate(bitsToGrey)
+    else:
+        if hasattr(tiles, "dtype"):
+            # bytes() of a wider numpy row would give several bytes per tile:
+            import numpy as np
+            tiles = np.asarray(tiles, dtype=np.uint8)
+        height = len(tiles)
+        width = len(tiles[0]) if height else 0
+        def greyRows ():
+            for row in tiles:
+                yield bytes(row).translate(toGrey)
+    _writeGreyImage(path, width, height, greyRows(), scale)
+
+def writeDungeonOverlayImage (path, dungeonSize, partitionsList, roomsList,
+                              bridgesList, scale=4):
+    """
+        Writes the partitions, rooms and bridges of a dungeon to an image file
+         without any display, in the style of generateDungeonVisualize:
+         partition outlines, black rooms and grey bridges on white.
+        The format follows path's extension: .png, .ppm or .pgm.
+        Each tile becomes a scale by scale pixel block.
+    """
+    width, height = dungeonSize
+    # Draw at one pixel per tile first, every rect is one slice per row:
+    pixels = bytearray([_IMAGE_EMPTY]) * (width * height)
+    for x0, y0, x1, y1 in _floorRects(dungeonSize, roomsList, ()):
+        roomRow = bytes([_IMAGE_ROOM]) * (x1 - x0)
+        for rowNum in range(y0, y1):
+            pixels[rowNum * width + x0:rowNum * width + x1] = roomRow
+    for x0, y0, x1, y1 in _floorRects(dungeonSize, (), bridgesList):
+        bridgeRow = bytes([_IMAGE_FLOOR]) * (x1 - x0)
+        for rowNum in range(y0, y1):
+            pixels[rowNum * width + x0:rowNum * width + x1] = bridgeRow
+    greyRows = (pixels[rowStart:rowStart + width]
+                for rowStart in range(0, width * height, width))
+    _writeGreyImage(path, width, height, greyRows, scale, partitionsList)
+
+def _writeGreyImage (path, width, height, greyRows, scale=1,
+                     partitionsList=()):
+    """
+        Encodes rows of 8-bit grey pixels into an image file, scaling each
+         pixel up to a scale by scale block and drawing 1 pixel partition
+         outlines on top.
+    """
+    scaledWidth = width * scale
+    scaledHeight = height * scale
+    # Horizontal partition outlines by scaled pixel row, and vertical ones by
+    #  the tile rows they start and stop at:
+    horizontalLines = {}
+    verticalStarts = {}
+    verticalEnds = {}
+    for x0, y0, x1, y1 in partitionsList:
+        for lineY in (y0 * scale, y1 * scale - 1):
+            horizontalLines.setdefault(lineY, []).append((x0 * scale,
+                                                          x1 * scale))
+        for lineX in (x0 * scale, x1 * scale - 1):
+            verticalStarts.setdefault(y0, []).append(lineX)
+            verticalEnds.setdefault(y1, []).append(lineX)
+
+    def scaledRows ():
+        scaledRow = bytearray(scaledWidth)
+        activeLines = {} # Scaled x -> number of vertical outlines on it.
+        for rowNum, greyRow in enumerate(greyRows):
+            for offset in range(scale):
+                scaledRow[offset::scale] = greyRow
+            # Sweep down the rows, so each row only visits the vertical
+            #  outlines crossing it:
+            for lineX in verticalEnds.get(rowNum, ()):
+                activeLines[lineX] -= 1
+                if not activeLines[lineX]:
+                    del activeLines[lineX]
+            for lineX in verticalStarts.get(rowNum, ()):
+                activeLines[lineX] = activeLines.get(lineX, 0) + 1
+            for lineX in activeLines:
+                scaledRow[lineX] = _IMAGE_PARTITION
+            for scaledY in range(rowNum * scale, rowNum * scale + scale):
+                if scaledY not in horizontalLines:
+                    yield bytes(scaledRow)
+                    continue
+                outlinedRow = bytearray(scaledRow)
+                for lineStart, lineEnd in horizontalLines[scaledY]:
+                    outlinedRow[lineStart:lineEnd] = \
+                        bytes([_IMAGE_PARTITION]) * (lineEnd - lineStart)
+                yield bytes(outlinedRow)
+
+    lowerPath = path.lower()
+    with open(path, "wb") as imageFile:
+        if lowerPath.endswith(".png"):
+            _writePng(imageFile, scaledWidth, scaledHeight, scaledRows())
+        elif lowerPath.endswith(".pgm"):
+            imageFile.write(b"P5 %d %d 255\n" % (scaledWidth, scaledHeight))
+            for row in scaledRows():
+                imageFile.write(row)
+        elif lowerPath.endswith(".ppm"):
+            imageFile.write(b"P6 %d %d 255\n" % (scaledWidth, scaledHeight))
+            rgbRow = bytearray(scaledWidth * 3)
+            for row in scaledRows():
+                rgbRow[0::3] = rgbRow[1::3] = rgbRow[2::3] = row
+                imageFile.write(rgbRow)
+        else:
+            raise ValueError("Unknown image format for %s (use .png, .ppm or "
+                             ".pgm)" % (path,))
+
+def _writePng (imageFile, width, height, greyRows):
+    """
+        Writes an 8-bit greyscale PNG, compressing rows as they come in.
+    """
+    import struct
+    import zlib
+
+    def writeChunk (chunkType, data):
+        imageFile.write(struct.pack(">I", len(data)) + chunkType + data +
+                        struct.pack(">I", zlib.crc32(chunkType + data)))
+
+    imageFile.write(b"\x89PNG\r\n\x1a\n")
+    writeChunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+    compressor = zlib.compressobj(6)
+    compressed = []
+    for row in greyRows:
+        compressed.append(compressor.compress(b"\x00" + row)) # No filter.
+    compressed.append(compressor.flush())
+    writeChunk(b"IDAT", b"".join(compressed))
+    writeChunk(b"IEND", b"")
+# --- ---
+
 class TreeNode ():
     """
         This class implements the tree behaviour of Binary Space Partitioning.
         Every TreeNode will have two sub-TreeNodes until we run out of space.
     """
-    def __init__ (self, origin, bounds, minNodeSize, iteration=0):
+    def __init__ (self, origin, bounds, minNodeSize, iteration=0, rng=None):
         # Store our information:
         self.origin = origin
         self.bounds = bounds
@@ -221,46 +2543,24 @@ class TreeNode ():
         self.afterSplitNode = None
         self.iteration = iteration # Used for str representation and debug.
         self.roomBounds = None
-        self._growTree(minNodeSize)
+        self.bridges = [] # Set by generateTreeBridges.
+        self._growTree(minNodeSize, rng)
 
-    def _growTree (self, minNodeSize):
+    def _growTree (self, minNodeSize, rng=None):
         """
             Called every init, this splits the node randomly into two subnodes.
+            Splits are drawn from rng, or from the random module if no rng is
+             given.
         """
-        isHorizontalSplit = random.random() >= 0.5
-        if isHorizontalSplit:
-            sliceStart = self.origin[1]
-            sliceEnd = self.bounds[1]
-            minSpacing = minNodeSize[1]
-            # If we have enough space to slice given our minimum spacing:
-            if not sliceStart + minSpacing >= sliceEnd - minSpacing:
-                splitPosition = random.randint(sliceStart + minSpacing,
-                                               sliceEnd - minSpacing)
-                self.beforeSplitNode = TreeNode((self.origin[0],
-                                                self.origin[1]),
-                                                (self.bounds[0], splitPosition),
-                                                minNodeSize, self.iteration+1)
-                self.afterSplitNode = TreeNode((self.origin[0], splitPosition),
-                                               (self.bounds[0], self.bounds[1]),
-                                               minNodeSize, self.iteration+1)
-        else:
-            # The idea is the same for a vertical split, but our constraints are
-            #  now about the x-axis
-            sliceStart = self.origin[0]
-            sliceEnd = self.bounds[0]
-            minSpacing = minNodeSize[0]
-            if not sliceStart + minSpacing >= sliceEnd - minSpacing:
-                splitPosition = random.randint(sliceStart + minSpacing,
-                                               sliceEnd - minSpacing)
-                self.beforeSplitNode = TreeNode((self.origin[0],
-                                                self.origin[1]),
-                                                (splitPosition, self.bounds[1]),
-                                                minNodeSize, self.iteration+1)
-                self.afterSplitNode = TreeNode((splitPosition, self.origin[1]),
-                                               (self.bounds[0], self.bounds[1]),
-                                               minNodeSize, self.iteration+1)
-
-    def getPartitionsList (self, partitionList=[]):
+        split = _splitPartition(self.origin, self.bounds, minNodeSize, rng)
+        if split != None:
+            (beforeOrigin, beforeBounds), (afterOrigin, afterBounds) = split
+            self.beforeSplitNode = TreeNode(beforeOrigin, beforeBounds,
+                                            minNodeSize, self.iteration+1, rng)
+            self.afterSplitNode = TreeNode(afterOrigin, afterBounds,
+                                           minNodeSize, self.iteration+1, rng)
+
+    def getPartitionsList (self, partitionList=None):
         """
             Returns this tree's slices in list form.
             E.g. [(0,0,100,100)]
@@ -268,6 +2568,8 @@ class TreeNode ():
              other nodes attached)
             Used for visualization.
         """
+        if partitionList == None:
+            partitionList = []
         # If we are a root node, we add our bounds to the list:
         if self.beforeSplitNode == None or self.afterSplitNode == None:
             partitionList.append((self.origin[0], self.origin[1],
@@ -281,11 +2583,13 @@ class TreeNode ():
                 self.afterSplitNode.getPartitionsList(partitionList)
         return partitionList # This will only matter at the top element!
 
-    def getRoomBridges (self, bridgesList=[]):
+    def getRoomBridges (self, bridgesList=None):
         """
             Returns a list of rects representing bridges between rooms
              throughout the entire dungeon tree.
         """
+        if bridgesList == None:
+            bridgesList = []
         bridgesList.extend(self.bridges)
         if self.beforeSplitNode != None:
             self.beforeSplitNode.getRoomBridges(bridgesList)
@@ -293,12 +2597,14 @@ class TreeNode ():
             self.afterSplitNode.getRoomBridges(bridgesList)
         return bridgesList
 
-    def getRoomsList (self, roomsList=[]):
+    def getRoomsList (self, roomsList=None):
         """
             Returns this tree's slices in list form.
             E.g. [(75,50,97,90), (...)]
             Used for Visualization
         """
+        if roomsList == None:
+            roomsList = []
         # If we have a room in the current node, then we add it to the list:
         if self.roomBounds != None:
             roomsList.append(self.roomBounds)
@@ -308,7 +2614,7 @@ class TreeNode ():
             self.afterSplitNode.getRoomsList(roomsList)
         return roomsList
 
-    def generateTreeRooms (self, biasRatio, biasStrength):
+    def generateTreeRooms (self, biasRatio, biasStrength, rng=None):
         """
             Generates rooms for this tree.
         """
@@ -317,11 +2623,44 @@ class TreeNode ():
             self.roomBounds = generateRoom((self.origin[0], self.origin[1],
                                            self.bounds[0], self.bounds[1]),
                                            biasRatio=biasRatio,
-                                           biasStrength=biasStrength)
+                                           biasStrength=biasStrength, rng=rng)
         if self.beforeSplitNode != None:
-            self.beforeSplitNode.generateTreeRooms(biasRatio, biasStrength)
+            self.beforeSplitNode.generateTreeRooms(biasRatio, biasStrength, rng)
         if self.afterSplitNode != None:
-            self.afterSplitNode.generateTreeRooms(biasRatio, biasStrength)
+            self.afterSplitNode.generateTreeRooms(biasRatio, biasStrength, rng)
+
+    def generateTreeBridges (self, maxBridgeWidth=1, rng=None,
+                             dungeonSize=None):
+        """
+            Bridges this tree's rooms bottom-up: each split node gets one bridge
+             (in its bridges) joining a room of its before split subtree to a
+             room of its after split subtree, so every room ends up connected
+             with one bridge per split. getRoomBridges then returns them all.
+            dungeonSize is the grid bridges are rasterized in (this node's
+             bounds by default).
+        """
+        if dungeonSize == None:
+            dungeonSize = self.bounds
+        self._bridgeSubtrees(dungeonSize, maxBridgeWidth, rng)
+
+    def _bridgeSubtrees (self, dungeonSize, maxBridgeWidth, rng):
+        """
+            Bridges the subtrees under this node and returns their extreme
+             rooms, see _bridgeSiblings.
+        """
+        if self.beforeSplitNode == None or self.afterSplitNode == None:
+            self.bridges = []
+            return _roomExtremes(self.roomBounds)
+        beforeExtremes = self.beforeSplitNode._bridgeSubtrees(dungeonSize,
+                                                              maxBridgeWidth,
+                                                              rng)
+        afterExtremes = self.afterSplitNode._bridgeSubtrees(dungeonSize,
+                                                            maxBridgeWidth, rng)
+        isVerticalSplit = self.afterSplitNode.origin[0] != self.origin[0]
+        self.bridges, extremes = _bridgeSiblings(dungeonSize, beforeExtremes,
+                                                 afterExtremes, isVerticalSplit,
+                                                 maxBridgeWidth, rng)
+        return extremes
 
     def __str__ (self):
         """
@@ -335,20 +2674,352 @@ class TreeNode ():
         afterSplitData = "After Split Branch: " + str(self.afterSplitNode)
         return ("%s\n%s\n%s\n%s") % (intro,data,beforeSplitData,afterSplitData)
 
+class FlatTree ():
+    """
+        An alternative tree engine to TreeNode for very large dungeons.
+        Nodes live in flat parallel arrays and the tree is grown and walked with
+         an explicit stack, so deep trees never hit the recursion limit.
+        Nodes are numbered in the order TreeNode visits them (depth first,
+         before split node first). The same random draws therefore give the
+         same partitions and rooms as TreeNode, and every subtree is a
+         contiguous run of node indices.
+    """
+    def __init__ (self, origin, bounds, minNodeSize, rng=None):
+        from array import array
+        self.x0s = array("q")
+        self.y0s = array("q")
+        self.x1s = array("q")
+        self.y1s = array("q")
+        self.beforeSplitNodes = array("q") # Child node index, -1 if none.
+        self.afterSplitNodes = array("q")
+        self.iterations = array("q")
+        self.roomBounds = []
+        self.bridges = [] # Bridges of split nodes, None until bridged.
+        self._growTree(origin, bounds, minNodeSize, rng)
+
+    def _growTree (self, origin, bounds, minNodeSize, rng=None):
+        """
+            Splits nodes until we run out of space, depth first.
+        """
+        # Each entry is (origin, bounds, iteration, parentIndex, isAfterSplit):
+        stack = [(origin, bounds, 0, -1, False)]
+        while stack:
+            origin, bounds, iteration, parentIndex, isAfterSplit = stack.pop()
+            nodeIndex = len(self.x0s)
+            self.x0s.append(origin[0])
+            self.y0s.append(origin[1])
+            self.x1s.append(bounds[0])
+            self.y1s.append(bounds[1])
+            self.beforeSplitNodes.append(-1)
+            self.afterSplitNodes.append(-1)
+            self.iterations.append(iteration)
+            self.roomBounds.append(None)
+            self.bridges.append(None)
+            if isAfterSplit:
+                self.afterSplitNodes[parentIndex] = nodeIndex
+            elif parentIndex != -1:
+                self.beforeSplitNodes[parentIndex] = nodeIndex
+
+            split = _splitPartition(origin, bounds, minNodeSize, rng)
+            if split != None:
+                # Push the after split node first so the before split node's
+                #  subtree is grown first, like TreeNode does:
+                (beforeOrigin, beforeBounds), (afterOrigin, afterBounds) = split
+                stack.append((afterOrigin, afterBounds, iteration+1, nodeIndex,
+                              True))
+                stack.append((beforeOrigin, beforeBounds, iteration+1,
+                              nodeIndex, False))
+
+    def __len__ (self):
+        return len(self.x0s)
+
+    def isLeaf (self, nodeIndex):
+        return self.beforeSplitNodes[nodeIndex] == -1
+
+    def getPartition (self, nodeIndex):
+        """
+            Returns the (x0, y0, x1, y1) partition of a node.
+        """
+        return (self.x0s[nodeIndex], self.y0s[nodeIndex],
+                self.x1s[nodeIndex], self.y1s[nodeIndex])
+
+    def subtreeEnd (self, nodeIndex):
+        """
+            Returns the index just past the last node under nodeIndex.
+        """
+        while self.afterSplitNodes[nodeIndex] != -1:
+            nodeIndex = self.afterSplitNodes[nodeIndex]
+        return nodeIndex + 1
+
+    def getPartitionsList (self, nodeIndex=0):
+        """
+            Returns the leaf partitions under nodeIndex in list form.
+            E.g. [(0,0,100,100)]
+        """
+        return [self.getPartition(leafIndex)
+                for leafIndex in range(nodeIndex, self.subtreeEnd(nodeIndex))
+                if self.beforeSplitNodes[leafIndex] == -1]
+
+    def getRoomsList (self, nodeIndex=0):
+        """
+            Returns the rooms under nodeIndex in list form.
+            E.g. [(75,50,97,90), (...)]
+        """
+        return [room for room in
+                self.roomBounds[nodeIndex:self.subtreeEnd(nodeIndex)]
+                if room != None]
+
+    def generateTreeRooms (self, biasRatio, biasStrength, rng=None,
+                           nodeIndex=0):
+        """
+            Generates rooms for the leaves under nodeIndex.
+        """
+        for leafIndex in range(nodeIndex, self.subtreeEnd(nodeIndex)):
+            if self.beforeSplitNodes[leafIndex] == -1:
+                self.roomBounds[leafIndex] = generateRoom(
+                    self.getPartition(leafIndex), biasRatio=biasRatio,
+                    biasStrength=biasStrength, rng=rng)
+
+    def generateTreeRoomsBatch (self, biasRatio, biasStrength, rng=None,
+                                nodeIndex=0):
+        """
+            Generates rooms for the leaves under nodeIndex all at once with
+             generateRoomsBatch. rng is a numpy Generator.
+        """
+        import numpy as np
+        end = self.subtreeEnd(nodeIndex)
+        # The node arrays are viewed as numpy arrays without copying:
+        leafIndices = nodeIndex + np.flatnonzero(
+            np.frombuffer(self.beforeSplitNodes, dtype=np.int64)[nodeIndex:end]
+            == -1)
+        partitions = np.stack([np.frombuffer(coords, dtype=np.int64)[leafIndices]
+                               for coords in (self.x0s, self.y0s,
+                                              self.x1s, self.y1s)], axis=1)
+        rooms = generateRoomsBatch(partitions, biasRatio, biasStrength, rng)
+        for leafIndex, room in zip(leafIndices.tolist(), rooms.tolist()):
+            self.roomBounds[leafIndex] = tuple(room)
+
+    def generateTreeBridges (self, maxBridgeWidth=1, rng=None,
+                             dungeonSize=None, nodeIndex=0):
+        """
+            Bridges the rooms under nodeIndex like TreeNode.generateTreeBridges,
+             drawing the same random values in the same order.
+        """
+        if dungeonSize == None:
+            dungeonSize = (self.x1s[nodeIndex], self.y1s[nodeIndex])
+        extremes = {}
+        # Visit children before their parent, before split subtree first:
+        stack = [(nodeIndex, False)]
+        while stack:
+            index, childrenDone = stack.pop()
+            beforeIndex = self.beforeSplitNodes[index]
+            afterIndex = self.afterSplitNodes[index]
+            if beforeIndex == -1:
+                extremes[index] = _roomExtremes(self.roomBounds[index])
+            elif not childrenDone:
+                stack.append((index, True))
+                stack.append((afterIndex, False))
+                stack.append((beforeIndex, False))
+            else:
+                self.bridges[index], extremes[index] = _bridgeSiblings(
+                    dungeonSize, extremes.pop(beforeIndex),
+                    extremes.pop(afterIndex),
+                    self.x0s[afterIndex] != self.x0s[index], maxBridgeWidth,
+                    rng)
+
+    def getRoomBridges (self, nodeIndex=0):
+        """
+            Returns the bridges generateTreeBridges made under nodeIndex, in the
+             order TreeNode.getRoomBridges gives them.
+        """
+        return [bridge for bridges in
+                self.bridges[nodeIndex:self.subtreeEnd(nodeIndex)]
+                if bridges != None for bridge in bridges]
+
+    def getNode (self, nodeIndex=0):
+        """
+            Returns a TreeNode-like view of a node (the root by default).
+        """
+        return FlatTreeNode(self, nodeIndex)
+
+class FlatTreeNode ():
+    """
+        A lightweight view of one FlatTree node that behaves like a TreeNode,
+         for code written against TreeNode.
+    """
+    __slots__ = ("tree", "index")
+
+    def __init__ (self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def origin (self):
+        return (self.tree.x0s[self.index], self.tree.y0s[self.index])
+
+    @property
+    def bounds (self):
+        return (self.tree.x1s[self.index], self.tree.y1s[self.index])
+
+    @property
+    def iteration (self):
+        return self.tree.iterations[self.index]
+
+    @property
+    def beforeSplitNode (self):
+        childIndex = self.tree.beforeSplitNodes[self.index]
+        return FlatTreeNode(self.tree, childIndex) if childIndex != -1 else None
+
+    @property
+    def afterSplitNode (self):
+        childIndex = self.tree.afterSplitNodes[self.index]
+        return FlatTreeNode(self.tree, childIndex) if childIndex != -1 else None
+
+    @property
+    def roomBounds (self):
+        return self.tree.roomBounds[self.index]
+
+    @roomBounds.setter
+    def roomBounds (self, room):
+        self.tree.roomBounds[self.index] = room
+
+    def getPartitionsList (self, partitionList=None):
+        if partitionList == None:
+            partitionList = []
+        partitionList.extend(self.tree.getPartitionsList(self.index))
+        return partitionList
+
+    def getRoomsList (self, roomsList=None):
+        if roomsList == None:
+            roomsList = []
+        roomsList.extend(self.tree.getRoomsList(self.index))
+        return roomsList
+
+    @property
+    def bridges (self):
+        bridges = self.tree.bridges[self.index]
+        return bridges if bridges != None else []
+
+    def getRoomBridges (self, bridgesList=None):
+        if bridgesList == None:
+            bridgesList = []
+        bridgesList.extend(self.tree.getRoomBridges(self.index))
+        return bridgesList
+
+    def generateTreeRooms (self, biasRatio, biasStrength, rng=None):
+        self.tree.generateTreeRooms(biasRatio, biasStrength, rng, self.index)
+
+    def generateTreeBridges (self, maxBridgeWidth=1, rng=None,
+                             dungeonSize=None):
+        self.tree.generateTreeBridges(maxBridgeWidth, rng, dungeonSize,
+                                      self.index)
+
+    def __str__ (self):
+        return TreeNode.__str__(self)
+
 # --- Generation Helper Functions ---
-def generateRoom (partition, biasRatio=0.75, biasStrength=0):
+def _splitPartition (origin, bounds, minNodeSize, rng=None):
+    """
+        Randomly picks a split axis and position for a partition.
+        Returns ((beforeOrigin, beforeBounds), (afterOrigin, afterBounds)), or
+         None if the partition is too small to split along the picked axis.
+    """
+    if rng == None:
+        rng = random
+    isHorizontalSplit = rng.random() >= 0.5
+    if isHorizontalSplit:
+        sliceStart = origin[1]
+        sliceEnd = bounds[1]
+        minSpacing = minNodeSize[1]
+        # If we have enough space to slice given our minimum spacing:
+        if not sliceStart + minSpacing >= sliceEnd - minSpacing:
+            splitPosition = rng.randint(sliceStart + minSpacing,
+                                           sliceEnd - minSpacing)
+            return (((origin[0], origin[1]), (bounds[0], splitPosition)),
+                    ((origin[0], splitPosition), (bounds[0], bounds[1])))
+    else:
+        # The idea is the same for a vertical split, but our constraints are
+        #  now about the x-axis
+        sliceStart = origin[0]
+        sliceEnd = bounds[0]
+        minSpacing = minNodeSize[0]
+        if not sliceStart + minSpacing >= sliceEnd - minSpacing:
+            splitPosition = rng.randint(sliceStart + minSpacing,
+                                           sliceEnd - minSpacing)
+            return (((origin[0], origin[1]), (splitPosition, bounds[1])),
+                    ((splitPosition, origin[1]), (bounds[0], bounds[1])))
+    return None
+
+def generateRoomsBatch (partitions, biasRatio=0.75, biasStrength=0, rng=None):
+    """
+        Vectorized generateRoom for many partitions at once (needs numpy).
+        Takes an (N, 4) array-like of (x0, y0, x1, y1) partitions and returns
+         an (N, 4) int64 array of rooms. Each room follows generateRoom's
+         distribution, bias blend and truncation exactly, but the random
+         offsets are drawn in bulk from rng, a numpy Generator (a fresh
+         numpy.random.default_rng() if not given).
+    """
+    import numpy as np
+    if rng == None:
+        rng = np.random.default_rng()
+    partitions = np.asarray(partitions, dtype=np.int64).reshape(-1, 4)
+    x0, y0, x1, y1 = partitions.T
+
+    xAvg = (x0 + x1) // 2
+    yAvg = (y0 + y1) // 2
+    # The random starting and ending points, like random.randrange:
+    xOriginRand = rng.integers(x0, xAvg)
+    yOriginRand = rng.integers(y0, yAvg)
+    xEndRand = rng.integers(xAvg, x1)
+    yEndRand = rng.integers(yAvg, y1)
+    # The points we are aiming towards:
+    xOriginBiasPoint = x0 + (x1 - x0) * (1-biasRatio)
+    yOriginBiasPoint = y0 + (y1 - y0) * (1-biasRatio)
+    xEndBiasPoint = x1 - (x1 - x0) * (1-biasRatio)
+    yEndBiasPoint = y1 - (y1 - y0) * (1-biasRatio)
+    # The final values, truncated towards zero like int():
+    rooms = np.stack([
+        xOriginRand + (xOriginBiasPoint - xOriginRand) * biasStrength,
+        yOriginRand + (yOriginBiasPoint - yOriginRand) * biasStrength,
+        xEndRand + (xEndBiasPoint - xEndRand) * biasStrength,
+        yEndRand + (yEndBiasPoint - yEndRand) * biasStrength], axis=1)
+    return np.trunc(rooms).astype(np.int64)
+
+def _generateTreeRoomsBatch (dungeonTree, biasRatio, biasStrength, rng):
+    """
+        Fills in the rooms of a TreeNode or FlatTree with generateRoomsBatch,
+         seeding its numpy Generator from rng so seeded dungeons stay
+         reproducible.
+    """
+    import numpy as np
+    numpyRng = np.random.default_rng(rng.getrandbits(64))
+    if isinstance(dungeonTree, FlatTree):
+        dungeonTree.generateTreeRoomsBatch(biasRatio, biasStrength, numpyRng)
+        return
+    leaves = _getLeaves(dungeonTree)
+    partitions = [(leaf.origin[0], leaf.origin[1], leaf.bounds[0],
+                   leaf.bounds[1]) for leaf in leaves]
+    rooms = generateRoomsBatch(partitions, biasRatio, biasStrength, numpyRng)
+    for leaf, room in zip(leaves, rooms.tolist()):
+        leaf.roomBounds = tuple(room)
+
+def generateRoom (partition, biasRatio=0.75, biasStrength=0, rng=None):
     """
         Generates and returns a room (tuple with 2 coordinate sets)
          of random size limited by a the given partition/boundary (x0,y0,x1,y1).
         If given a bias, it will attempt to make the room match biasRatio of the
          partition with biasStrength.
+        Random values are drawn from rng (a random.Random), or from the random
+         module if no rng is given.
     """
+    if rng == None:
+        rng = random
     # We will refer to the origin and bounds as follows (for readability):
     x0, y0, x1, y1 = partition[0], partition[1], partition[2], partition[3]
 
     xAvg = (x0 + x1) // 2
     # The random starting point:
-    xOriginRand = random.randrange(x0, xAvg)
+    xOriginRand = rng.randrange(x0, xAvg)
     # The point we are aiming towards:
     xOriginBiasPoint = x0 + (x1 - x0) * (1-biasRatio)
     # The final value:
@@ -356,21 +3027,21 @@ def generateRoom (partition, biasRatio=0.75, biasStrength=0):
                     * biasStrength)
 
     yAvg = (y0 + y1) // 2
-    yOriginRand = random.randrange(y0, yAvg)
+    yOriginRand = rng.randrange(y0, yAvg)
     yOriginBiasPoint = y0 + (y1 - y0) * (1-biasRatio)
     roomOriginY = int(yOriginRand + (yOriginBiasPoint - yOriginRand)\
                     * biasStrength)
 
-    xEndRand = random.randrange(xAvg, x1)
+    xEndRand = rng.randrange(xAvg, x1)
     xEndBiasPoint = x1 - (x1 - x0) * (1-biasRatio)
     roomEndX = int(xEndRand + (xEndBiasPoint - xEndRand) * biasStrength)
 
-    yEndRand = random.randrange(yAvg, y1)
+    yEndRand = rng.randrange(yAvg, y1)
     yEndBiasPoint = y1 - (y1 - y0) * (1-biasRatio)
     roomEndY = int(yEndRand + (yEndBiasPoint - yEndRand) * biasStrength)
     return (roomOriginX, roomOriginY, roomEndX, roomEndY)
 
-def generateBridge (room1, room2, maxBridgeWidth=1):
+def generateBridge (room1, room2, maxBridgeWidth=1, rng=None):
     """
         Generates a bridge between two rooms. Returns this bridge in rect. form.
          (x0, y0, x1, y1)
@@ -383,7 +3054,11 @@ def generateBridge (room1, room2, maxBridgeWidth=1):
          - Pick a random point on the second room's edge.
          - Pick a midpoint between the two edges on the predetermined axis.
          - Create three rectangles connecting these points.
+        Random points are drawn from rng, or from the random module if no rng
+         is given.
     """
+    if rng == None:
+        rng = random
     # Determine direction of the bridge:
     horizontalBridge = False
     direction = (room2[0] - room1[2], room2[1] - room1[3])
@@ -394,22 +3069,22 @@ def generateBridge (room1, room2, maxBridgeWidth=1):
         # Horizontal takes ties.
         horizontalBridge = True
     bridge = [] # List of 3 rectangles
-    bridgeWidth = random.randint(0, maxBridgeWidth)
+    bridgeWidth = rng.randint(0, maxBridgeWidth)
     # Find point on edge of first room (will be a range of values):
     if horizontalBridge:
         # Pick point range on right or left edge:
         if direction[0] > 0: # Going right
             bridgeStartX = room1[2]
-            bridgeStartY = random.randint(min(room1[1], room1[3]), max(room1[1], room1[3]))
+            bridgeStartY = rng.randint(min(room1[1], room1[3]), max(room1[1], room1[3]))
             bridgeEndX = room2[0]
-            bridgeEndY = random.randint(min(room2[1], room2[3]), max(room2[1], room2[3]))
-            bridgeMidpoint = random.randint(min(room1[2], room2[0]), max(room1[2], room2[0]))
+            bridgeEndY = rng.randint(min(room2[1], room2[3]), max(room2[1], room2[3]))
+            bridgeMidpoint = rng.randint(min(room1[2], room2[0]), max(room1[2], room2[0]))
         elif direction[0] < 0: # Going left, we instead bridge 2 to 1:
             bridgeStartX = room2[2]
-            bridgeStartY = random.randint(min(room2[1], room2[3]), max(room2[1], room2[3]))
+            bridgeStartY = rng.randint(min(room2[1], room2[3]), max(room2[1], room2[3]))
             bridgeEndX = room1[0]
-            bridgeEndY = random.randint(min(room1[1], room1[3]), max(room1[1], room1[3]))
-            bridgeMidpoint = random.randint(min(room1[0], room2[2]), max(room1[0], room2[2]))
+            bridgeEndY = rng.randint(min(room1[1], room1[3]), max(room1[1], room1[3]))
+            bridgeMidpoint = rng.randint(min(room1[0], room2[2]), max(room1[0], room2[2]))
         bridge.append((bridgeStartX, bridgeStartY - bridgeWidth,
                       bridgeMidpoint, bridgeStartY + bridgeWidth))
         bridge.append((bridgeMidpoint - bridgeWidth, bridgeStartY - bridgeWidth,
@@ -419,16 +3094,16 @@ def generateBridge (room1, room2, maxBridgeWidth=1):
     else:
         if direction[1] < 0: # Going down
             bridgeStartY = room1[3]
-            bridgeStartX = random.randint(min(room1[0], room1[2]), max(room1[0], room1[2]))
+            bridgeStartX = rng.randint(min(room1[0], room1[2]), max(room1[0], room1[2]))
             bridgeEndY = room2[1]
-            bridgeEndX = random.randint(min(room2[0], room2[2]), max(room2[0], room2[2]))
-            bridgeMidpoint = random.randint(min(room1[3], room2[1]), max(room1[3], room2[1])) # Midpoint in y
+            bridgeEndX = rng.randint(min(room2[0], room2[2]), max(room2[0], room2[2]))
+            bridgeMidpoint = rng.randint(min(room1[3], room2[1]), max(room1[3], room2[1])) # Midpoint in y
         elif direction[1] > 0: # Going up
             bridgeStartY = room2[3]
-            bridgeStartX = random.randint(min(room2[0], room2[2]), max(room2[0], room2[2]))
+            bridgeStartX = rng.randint(min(room2[0], room2[2]), max(room2[0], room2[2]))
             bridgeEndY = room1[1]
-            bridgeEndX = random.randint(min(room1[0], room1[2]), max(room1[0], room1[2]))
-            bridgeMidpoint = random.randint(min(room2[3], room1[1]), max(room2[3], room1[1]))
+            bridgeEndX = rng.randint(min(room1[0], room1[2]), max(room1[0], room1[2]))
+            bridgeMidpoint = rng.randint(min(room2[3], room1[1]), max(room2[3], room1[1]))
         bridge.append((bridgeStartX - bridgeWidth, bridgeStartY,
                       bridgeStartX + bridgeWidth, bridgeMidpoint))
         bridge.append((bridgeStartX - bridgeWidth, bridgeMidpoint - bridgeWidth,
@@ -437,28 +3112,132 @@ def generateBridge (room1, room2, maxBridgeWidth=1):
                       bridgeEndX + bridgeWidth, bridgeEndY))
     return bridge
 
-def generateTreeBridges (roomList, maxBridgeWidth=1):
+def generateTreeBridges (roomList, maxBridgeWidth=1, rng=None):
     """
         Given a list of rooms, returns a list of rect. representing bridges.
         Attempts to connect each room to the closest room not already connected.
+        Bridges are drawn from rng, or from the random module if no rng is
+         given.
     """
     bridges = []
-    roomsLeft = roomList[:]
+    for currentIndex, closestIndex in _closestRoomChain(roomList):
+        bridges.extend(generateBridge(roomList[currentIndex],
+                                      roomList[closestIndex],
+                                      maxBridgeWidth, rng))
+    return bridges
+
+def _closestRoomChain (roomList):
+    """
+        Yields the (currentIndex, closestIndex) room pairs generateTreeBridges
+         bridges: starting from the first room, each room is paired with the
+         closest room not already in the chain.
+        Closest rooms are looked up in a _RoomCenterGrid, which picks the same
+         room findClosestRoom would without scanning every room left.
+    """
+    if not roomList:
+        return
+    roomGrid = _RoomCenterGrid(roomList)
 
     # Keep bridging the closest room until we run out of rooms:
-    currentRoom = roomsLeft[0]
+    currentIndex = 0
     while True:
         # Find closest room to the current room:
-        listWithoutCurrent = roomsLeft[:]
-        roomsLeft.remove(currentRoom)
-        closestRoom = findClosestRoom(currentRoom, roomsLeft)
-        if (closestRoom):
-            bridges.extend(generateBridge(currentRoom, closestRoom, maxBridgeWidth))
-            currentRoom = closestRoom
+        roomGrid.remove(currentIndex)
+        closestIndex = roomGrid.findClosest(currentIndex)
+        if closestIndex != None:
+            yield currentIndex, closestIndex
+            currentIndex = closestIndex
         else:
             # No more rooms left
             break
-    return bridges
+
+def _roomExtremes (room):
+    """
+        Returns the extreme rooms of a subtree holding just room, see
+         _bridgeSiblings, or None if there is no room.
+    """
+    if room == None:
+        return None
+    return (room, room, room, room)
+
+def _bridgeSiblings (dungeonSize, beforeExtremes, afterExtremes,
+                     isVerticalSplit, maxBridgeWidth=1, rng=None):
+    """
+        Bridges two sibling subtrees, given the (leftmost, topmost, rightmost,
+         bottommost) rooms of each: the before split subtree's room reaching
+         furthest towards the split is joined to the after split subtree's
+         room reaching furthest back towards it.
+        The rooms get a generateBridge bridge, or an L corridor between their
+         centers (see _lCorridor) when that bridge doesn't join them.
+        Returns (bridges, extreme rooms of both subtrees together), in O(1).
+    """
+    if beforeExtremes == None or afterExtremes == None:
+        return [], _mergeExtremes(beforeExtremes, afterExtremes)
+    room1, room2 = _siblingRooms(beforeExtremes, afterExtremes,
+                                 isVerticalSplit)
+    bridges = generateBridge(room1, room2, maxBridgeWidth, rng)
+    if not _bridgeJoins(dungeonSize, room1, room2, bridges):
+        bridges = _lCorridor(room1, room2)
+    return bridges, _mergeExtremes(beforeExtremes, afterExtremes)
+
+def _siblingRooms (beforeExtremes, afterExtremes, isVerticalSplit):
+    """
+        Returns the (before, after) rooms _bridgeSiblings joins.
+    """
+    if isVerticalSplit:
+        return beforeExtremes[2], afterExtremes[0]
+    return beforeExtremes[3], afterExtremes[1]
+
+def _mergeExtremes (beforeExtremes, afterExtremes):
+    """
+        Returns the extreme rooms of two sibling subtrees together.
+    """
+    if beforeExtremes == None or afterExtremes == None:
+        return beforeExtremes if afterExtremes == None else afterExtremes
+    return (min(beforeExtremes[0], afterExtremes[0],
+                key=lambda room: min(room[0], room[2])),
+            min(beforeExtremes[1], afterExtremes[1],
+                key=lambda room: min(room[1], room[3])),
+            max(beforeExtremes[2], afterExtremes[2],
+                key=lambda room: max(room[0], room[2])),
+            max(beforeExtremes[3], afterExtremes[3],
+                key=lambda room: max(room[1], room[3])))
+
+def _treeBridgeRooms (node):
+    """
+        Returns (extremes, joins) for a TreeNode subtree bridged with
+         generateTreeBridges: its extreme rooms, and a (splitNode, room1, room2)
+         for the rooms joined by each split's bridges, in getRoomBridges order.
+    """
+    if node.beforeSplitNode == None or node.afterSplitNode == None:
+        return _roomExtremes(node.roomBounds), []
+    beforeExtremes, beforeJoins = _treeBridgeRooms(node.beforeSplitNode)
+    afterExtremes, afterJoins = _treeBridgeRooms(node.afterSplitNode)
+    joins = []
+    if beforeExtremes != None and afterExtremes != None:
+        isVerticalSplit = node.afterSplitNode.origin[0] != node.origin[0]
+        joins.append((node,) + _siblingRooms(beforeExtremes, afterExtremes,
+                                             isVerticalSplit))
+    return (_mergeExtremes(beforeExtremes, afterExtremes),
+            joins + beforeJoins + afterJoins)
+
+def _bridgeJoins (dungeonSize, room1, room2, bridges):
+    """
+        Returns True if the floor of room1, bridges and room2 is connected.
+    """
+    reached = list(_roomFloorRects(dungeonSize, room1))
+    targets = list(_roomFloorRects(dungeonSize, room2))
+    unreached = [rect for bounds in bridges
+                 for rect in _bridgeFloorRects(dungeonSize, bounds)]
+    unreached.extend(targets)
+    frontier = reached
+    while frontier:
+        frontier = [rect for rect in unreached
+                    if any(_rectsConnect(rect, other) for other in frontier)]
+        unreached = [rect for rect in unreached if rect not in frontier]
+        if any(rect in frontier for rect in targets):
+            return True
+    return False
 
 def findClosestRoom (room, roomList):
     """
@@ -480,9 +3259,284 @@ def findClosestRoom (room, roomList):
             currentClosest = compareRoom
             closestDistance = dist
     return currentClosest
+
+def _roomCenter (room):
+    """
+        Returns the center findClosestRoom measures room distances from.
+    """
+    return (room[0] + (room[0] + room[2]) // 2,
+            room[1] + (room[1] + room[3]) // 2)
+
+def _closestCenterIndex (center, centers, indices):
+    """
+        Returns the index among indices whose center in centers is closest to
+         center, or None if there are none. Ties go to the lowest index.
+    """
+    closest = None
+    closestDistance = None
+    for compareIndex in indices:
+        compareCenter = centers[compareIndex]
+        dist = ((compareCenter[0] - center[0]) ** 2 +
+                (compareCenter[1] - center[1]) ** 2)
+        if (closest == None or dist < closestDistance or
+            (dist == closestDistance and compareIndex < closest)):
+            closest = compareIndex
+            closestDistance = dist
+    return closest
+
+class _RoomCenterGrid ():
+    """
+        A uniform grid of buckets over the room centers of a room list.
+        Rooms can be removed, and findClosest answers which remaining room is
+         closest to a given room by searching outwards ring by ring.
+        Ties go to the room earliest in the room list, just like
+         findClosestRoom.
+    """
+    def __init__ (self, roomList):
+        self.centers = [_roomCenter(room) for room in roomList]
+        self.roomsLeft = set(range(len(roomList)))
+        xs = [center[0] for center in self.centers]
+        ys = [center[1] for center in self.centers]
+        self.minX = min(xs)
+        self.minY = min(ys)
+        # Size cells so that there is about one room per cell:
+        area = (max(xs) - self.minX + 1) * (max(ys) - self.minY + 1)
+        self.cellSize = max(1, int((area / len(roomList)) ** 0.5))
+        self.cols = (max(xs) - self.minX) // self.cellSize + 1
+        self.rows = (max(ys) - self.minY) // self.cellSize + 1
+        self.cells = [[] for i in range(self.cols * self.rows)]
+        for roomIndex in range(len(roomList)):
+            self.cells[self._cellIndex(roomIndex)].append(roomIndex)
+
+    def _cellIndex (self, roomIndex):
+        center = self.centers[roomIndex]
+        col = (center[0] - self.minX) // self.cellSize
+        row = (center[1] - self.minY) // self.cellSize
+        return row * self.cols + col
+
+    def remove (self, roomIndex):
+        """
+            Removes a room from the grid so it is never returned again.
+        """
+        self.cells[self._cellIndex(roomIndex)].remove(roomIndex)
+        self.roomsLeft.discard(roomIndex)
+
+    def add (self, roomIndex):
+        """
+            Puts a removed room back in the grid.
+        """
+        self.cells[self._cellIndex(roomIndex)].append(roomIndex)
+        self.roomsLeft.add(roomIndex)
+
+    def findClosest (self, roomIndex):
+        """
+            Returns the index of the remaining room closest to the room at
+             roomIndex, or None if no rooms are left.
+        """
+        center = self.centers[roomIndex]
+        col = (center[0] - self.minX) // self.cellSize
+        row = (center[1] - self.minY) // self.cellSize
+        closest = None
+        closestDistance = None
+        cellsSearched = 0
+        ring = 0
+        while self.roomsLeft:
+            ringCells = self._ringCells(col, row, ring)
+            if not ringCells:
+                break # We have searched the entire grid.
+            cellsSearched += len(ringCells)
+            if cellsSearched > len(self.roomsLeft):
+                # Few rooms are left, checking them all is cheaper:
+                return _closestCenterIndex(center, self.centers,
+                                           self.roomsLeft)
+            for cellIndex in ringCells:
+                for compareIndex in self.cells[cellIndex]:
+                    compareCenter = self.centers[compareIndex]
+                    dist = ((compareCenter[0] - center[0]) ** 2 +
+                            (compareCenter[1] - center[1]) ** 2)
+                    if (closest == None or dist < closestDistance or
+                        (dist == closestDistance and compareIndex < closest)):
+                        closest = compareIndex
+                        closestDistance = dist
+            # Rooms in the next rings are more than ring * cellSize away:
+            if (closest != None and
+                closestDistance < (ring * self.cellSize + 1) ** 2):
+                break
+            ring += 1
+        return closest
+
+    def _ringCells (self, col, row, ring):
+        """
+            Returns the indices of the cells exactly ring cells away from
+             (col, row) that lie inside the grid.
+        """
+        if ring == 0:
+            return [row * self.cols + col]
+        ringCells = []
+        colStart = max(col - ring, 0)
+        colEnd = min(col + ring, self.cols - 1)
+        for ringRow in (row - ring, row + ring):
+            if 0 <= ringRow < self.rows:
+                ringCells.extend(range(ringRow * self.cols + colStart,
+                                       ringRow * self.cols + colEnd + 1))
+        rowStart = max(row - ring + 1, 0)
+        rowEnd = min(row + ring - 1, self.rows - 1)
+        for ringCol in (col - ring, col + ring):
+            if 0 <= ringCol < self.cols:
+                ringCells.extend(ringRow * self.cols + ringCol
+                                 for ringRow in range(rowStart, rowEnd + 1))
+        return ringCells
+# --- ---
+
+# --- Bulk Generation CLI ---
+def _generateCommand (argv):
+    """
+        python pybsp.py generate: generates the dungeons of a seed range without
+         any window and streams them to stdout or writes one file per seed.
+        Formats (one record per dungeon, in seed order):
+         - ndjson: {"seed", "dungeonSize", "rooms", "bridges"} on one line
+         - packed: a "<qII" (seed, width, height) header, then PackedDungeon
+          data, so seeds must fit in a signed 64-bit int
+         - ascii: a "seed N" line, one line per row ('.' floor, '#' wall), then
+          an empty line
+        A throughput summary goes to stderr.
+    """
+    import argparse
+    import functools
+    import os
+    import sys
+    parser = argparse.ArgumentParser(prog='pybsp.py generate',
+                                     description='Generate dungeons in bulk, without a window')
+    parser.add_argument('--seeds', default=(0, 100), nargs=2, type=int,
+                        metavar=('FIRST', 'STOP'),
+                        help='Generate seeds FIRST up to (not including) STOP.')
+    parser.add_argument('--dungeonSize', default=(100,100), nargs=2, type=int,
+                        help='Size of the dungeons to generate.')
+    parser.add_argument('--minNodeSize', default=(20,20), nargs=2, type=int,
+                        help='Minimum size of the dungeons\' smallest partitions.')
+    parser.add_argument('--biasRatio', default=0.75, type=float,
+                        help='The ratio of the room to the partition.')
+    parser.add_argument('--biasStrength', default=0, type=float,
+                        help='The percent strength of the room\'s attempt to get to the biasRatio.')
+    parser.add_argument('--bridgeWidth', default=1, type=int,
+                        help='Maximum width of the bridges.')
+    parser.add_argument('--bridging', default="closest", choices=["closest", "tree"],
+                        help='Bridge each room to its closest room, or along the tree.')
+    parser.add_argument('--treeEngine', default="recursive", choices=["recursive", "flat"],
+                        help='Tree engine to grow the dungeons with.')
+    parser.add_argument('--format', default="ndjson", choices=["ndjson", "packed", "ascii"],
+                        help='Output format.')
+    parser.add_argument('--outDir', default=None,
+                        help='Write one file per dungeon here instead of to stdout.')
+    parser.add_argument('--workers', default=0, type=int,
+                        help='Worker processes, 0 generates in this process.')
+    parser.add_argument('--chunkSize', default=16, type=int,
+                        help='Dungeons per worker task and per write.')
+    args = parser.parse_args(argv)
+    if args.format == "packed" and not all(-2 ** 63 <= seed <= 2 ** 63
+                                           for seed in args.seeds):
+        parser.error("--format packed needs seeds that fit in a signed 64-bit int")
+
+    params = ({"dungeonSize": tuple(args.dungeonSize),
+               "minNodeSize": tuple(args.minNodeSize),
+               "biasRatio": args.biasRatio, "biasStrength": args.biasStrength,
+               "maxBridgeWidth": args.bridgeWidth, "bridging": args.bridging,
+               "treeEngine": args.treeEngine, "seed": seed}
+              for seed in range(*args.seeds))
+    encodeChunk = functools.partial(_encodeDungeonChunk,
+                                    outputFormat=args.format)
+    extension = {"ndjson": ".json", "packed": ".bin", "ascii": ".txt"}
+    if args.outDir != None:
+        os.makedirs(args.outDir, exist_ok=True)
+    output = sys.stdout.buffer
+
+    startTime = time.perf_counter()
+    dungeons = 0
+    bytesWritten = 0
+    try:
+        for records in _mapChunks(encodeChunk, _chunked(params, args.chunkSize),
+                                  args.workers):
+            if args.outDir == None:
+                # One write per chunk keeps syscalls down on big runs:
+                chunkBytes = b"".join(record for seed, record in records)
+                output.write(chunkBytes)
+                bytesWritten += len(chunkBytes)
+            else:
+                for seed, record in records:
+                    path = os.path.join(args.outDir, "dungeon-%d%s" %
+                                        (seed, extension[args.format]))
+                    with open(path, "wb") as dungeonFile:
+                        dungeonFile.write(record)
+                    bytesWritten += len(record)
+            dungeons += len(records)
+        output.flush()
+    except BrokenPipeError:
+        # The reader (e.g. head) has had enough, stop quietly:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), output.fileno())
+        return 1
+    seconds = time.perf_counter() - startTime
+    tiles = dungeons * args.dungeonSize[0] * args.dungeonSize[1]
+    print("Generated %d dungeons (%d tiles) in %.2fs: %.1f dungeons/s, "
+          "%.0f tiles/s, %.1f MB written" %
+          (dungeons, tiles, seconds, dungeons / seconds if seconds else 0,
+           tiles / seconds if seconds else 0, bytesWritten / 1e6),
+          file=sys.stderr)
+    return 0
+
+def _encodeDungeonChunk (paramsChunk, outputFormat):
+    """
+        Worker side of the generate command: generates a chunk of dungeons and
+         returns their (seed, encoded record) pairs.
+    """
+    import json
+    import struct
+    records = []
+    for params in paramsChunk:
+        params = dict(params)
+        dungeonSize = params.pop("dungeonSize")
+        minNodeSize = params.pop("minNodeSize")
+        dungeonTree, roomsList, bridgesList = generateDungeonRects(dungeonSize,
+                                                                   minNodeSize,
+                                                                   **params)
+        if outputFormat == "ndjson":
+            record = json.dumps({"seed": params["seed"],
+                                 "dungeonSize": dungeonSize,
+                                 "rooms": roomsList, "bridges": bridgesList},
+                                separators=(",", ":")).encode() + b"\n"
+        else:
+            tiles = rasterizeDungeon(dungeonSize, roomsList, bridgesList,
+                                     "packed")
+            if outputFormat == "packed":
+                record = struct.pack("<qII", params["seed"], dungeonSize[0],
+                                     dungeonSize[1]) + tiles.data
+            else:
+                record = b"seed %d\n%s\n" % (params["seed"],
+                                               _asciiRows(tiles))
+        records.append((params["seed"], bytes(record)))
+    return records
+
+# Maps the binary digits of a row's bit mask to ASCII tiles:
+_ASCII_TILES = bytes.maketrans(b"01", b"#.")
+
+def _asciiRows (tiles):
+    """
+        Returns a PackedDungeon's rows as ASCII lines, '.' floor and '#' wall.
+    """
+    width, height = tiles.dungeonSize
+    rowBytes = tiles.rowBytes
+    bitsFormat = "0%db" % (rowBytes * 8)
+    return b"".join(
+        format(int.from_bytes(tiles.data[rowStart:rowStart + rowBytes], "big"),
+               bitsFormat)[:width].encode().translate(_ASCII_TILES) + b"\n"
+        for rowStart in range(0, rowBytes * height, rowBytes))
 # --- ---
 
 if __name__ == "__main__": # If we aren't used as a module, do the visualization
+    import sys
+    if sys.argv[1:2] == ["generate"]:
+        # Headless bulk generation, see _generateCommand:
+        sys.exit(_generateCommand(sys.argv[2:]))
+
     import argparse
     parser = argparse.ArgumentParser(description='Run Dungeon Visualization')
     parser.add_argument('--dungeonSize', default=(100,100), nargs='+', type=int,
@@ -497,21 +3551,48 @@ if __name__ == "__main__": # If we aren't used as a module, do the visualization
                         help='Display window size.')
     parser.add_argument('--bridgeWidth', default=1, type=int,
                         help='Maximum width of the bridges. 1 translates to +- 1. Must be non-negative.')
+    parser.add_argument('--seed', default=None, type=int,
+                        help='Seed for a reproducible dungeon.')
+    parser.add_argument('--bridging', default="closest", choices=["closest", "tree"],
+                        help='Bridge each room to its closest room, or along the tree.')
     parser.add_argument('--visualizeTiles', default=False, type=bool, nargs="?", const=True,
                         help='Use grid/tile visualization?')
+    parser.add_argument('--export', default=None,
+                        help='Write the visualization to this .png/.ppm/.pgm file instead of opening a window.')
     args = parser.parse_args()
 
-    if args.visualizeTiles == True:
+    if args.export != None:
+        # Headless: one pixel block per tile, sized like the window would be.
+        scale = max(1, min(args.winSize[0] // args.dungeonSize[0],
+                           args.winSize[1] // args.dungeonSize[1]))
+        dungeonTree, roomsList, bridgesList = generateDungeonRects(
+            args.dungeonSize, args.minNodeSize, biasRatio=args.biasRatio,
+            biasStrength=args.biasStrength, maxBridgeWidth=args.bridgeWidth,
+            bridging=args.bridging, seed=args.seed)
+        if args.visualizeTiles == True:
+            writeDungeonImage(args.export, rasterizeDungeon(args.dungeonSize,
+                                                            roomsList,
+                                                            bridgesList,
+                                                            "packed"), scale)
+        else:
+            writeDungeonOverlayImage(args.export, args.dungeonSize,
+                                     dungeonTree.getPartitionsList(), roomsList,
+                                     bridgesList, scale)
+    elif args.visualizeTiles == True:
         generateDungeonVisualizeTiles(args.dungeonSize, args.minNodeSize,
                                       biasRatio=args.biasRatio,
                                       biasStrength=args.biasStrength,
                                       winWidth=args.winSize[0],
                                       winHeight=args.winSize[1],
-                                      maxBridgeWidth=args.bridgeWidth)
+                                      maxBridgeWidth=args.bridgeWidth,
+                                      bridging=args.bridging,
+                                      seed=args.seed)
     else:
         generateDungeonVisualize(args.dungeonSize, args.minNodeSize,
                                  biasRatio=args.biasRatio,
                                  biasStrength=args.biasStrength,
                                  winWidth=args.winSize[0],
                                  winHeight=args.winSize[1],
-                                 maxBridgeWidth=args.bridgeWidth)
+                                 maxBridgeWidth=args.bridgeWidth,
+                                 bridging=args.bridging,
+                                 seed=args.seed)
@@ -0,0 +1,376 @@
+"""
+    A local asyncio dungeon generation service.
+    Clients connect over TCP or a Unix socket and send one JSON request per
+     line, e.g. {"dungeonSize": [100, 100], "minNodeSize": [20, 20], "seed": 7}.
+     Each dungeon is answered with a JSON header line
+     {"dungeonSize": ..., "seed": ..., "pooled": ..., "length": n} followed by
+     n bytes of PackedDungeon data. {"metrics": true} is answered with a JSON
+     line of service metrics, and bad requests with {"error": "..."}.
+    Generation runs on a process pool. For popular parameter sets the service
+     keeps a pool of dungeons generated ahead of time, and requests for them
+     without a seed are answered straight from it.
+
+    Run it with e.g.:
+        python pybsp_service.py --tcp 127.0.0.1:8765 --warm 100x100/20x20:32
+"""
+import asyncio
+import json
+import random
+import time
+
+import pybsp
+
+# Request fields passed on to generateDungeonRects:
+REQUEST_FIELDS = ("dungeonSize", "minNodeSize", "seed", "biasRatio",
+                  "biasStrength", "maxBridgeWidth", "treeEngine",
+                  "bridging", "ensureConnected")
+
+def _normalizeParams (request):
+    """
+        Returns the generation params of a request as a dict, with lists turned
+         into tuples. Raises ValueError for unknown or malformed fields.
+    """
+    params = {}
+    for field, value in request.items():
+        if field not in REQUEST_FIELDS:
+            raise ValueError("Unknown request field: %s" % field)
+        if field == "seed" and value == None:
+            continue
+        if field in ("dungeonSize", "minNodeSize"):
+            if len(value) != 2 or not all(isinstance(v, int) and v > 0
+                                          for v in value):
+                raise ValueError("%s must be two positive integers" % field)
+            value = tuple(value)
+        params[field] = value
+    params.setdefault("dungeonSize", (100, 100))
+    params.setdefault("minNodeSize", (20, 20))
+    return params
+
+def _poolKey (params):
+    """
+        Returns the key of the parameter set of params, ignoring the seed.
+    """
+    return json.dumps(dict((field, value) for field, value in params.items()
+                           if field != "seed"), sort_keys=True)
+
+def _generatePacked (params):
+    """
+        Worker side of the service: returns the packed tiles of one dungeon.
+    """
+    packedDungeons, workerStats = pybsp._generatePackedChunk([params])
+    return bytes(packedDungeons[0].data)
+
+class DungeonService ():
+    """
+        Serves dungeon generation requests, see the module docstring.
+        warmParams is a list of (params, poolSize) with the parameter sets to
+         keep poolSize pre-generated dungeons of. Refills only use workers that
+         requests aren't waiting for.
+        start generates each warm parameter set once and raises ValueError
+         for a set that can't be generated. If a refill still fails, the
+         error is counted and that pool is no longer refilled.
+    """
+    def __init__ (self, workers=None, warmParams=(), latencyWindow=1024):
+        import os
+        from collections import deque
+
+        self.workers = workers if workers != None else os.cpu_count()
+        self.pool = None
+        self.warmPools = {} # poolKey -> (params, poolSize, deque of entries)
+        for params, poolSize in warmParams:
+            params = _normalizeParams(params)
+            self.warmPools[_poolKey(params)] = (params, poolSize, deque())
+        self._refillCounts = dict((key, 0) for key in self.warmPools)
+        self._refillTasks = set()
+        self.failedPools = set() # Keys of warm pools that failed to refill.
+        self.refillsInFlight = 0
+        self.jobsInFlight = 0 # Requests waiting on the process pool.
+        self.latencies = deque(maxlen=latencyWindow)
+        self.counters = {"requests": 0, "pooled": 0, "generated": 0,
+                         "errors": 0, "refilled": 0}
+        self._refillWanted = None
+
+    async def start (self, tcp=None, unixPath=None):
+        """
+            Starts the process pool, the refill task and the server on a
+             (host, port) tcp address or a Unix socket path.
+            Returns the asyncio server.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        self.pool = ProcessPoolExecutor(self.workers)
+        # Generate every warm parameter set once, so one that can't be
+        #  generated is rejected here instead of failing every refill:
+        for key, (params, poolSize, entries) in self.warmPools.items():
+            params = dict(params, seed=random.getrandbits(63))
+            try:
+                data = await self._generate(params)
+            except Exception as error:
+                self.pool.shutdown(cancel_futures=True)
+                raise ValueError("Can't generate warm parameter set %s: %s" %
+                                 (key, error))
+            entries.append((params["seed"], data))
+            self.counters["refilled"] += 1
+        self._refillWanted = asyncio.Event()
+        self._refillWanted.set()
+        self._refillTask = asyncio.ensure_future(self._refillLoop())
+        if unixPath != None:
+            self.server = await asyncio.start_unix_server(self._handleClient,
+                                                          unixPath)
+        else:
+            host, port = tcp if tcp != None else ("127.0.0.1", 8765)
+            self.server = await asyncio.start_server(self._handleClient, host,
+                                                     port)
+        return self.server
+
+    async def close (self):
+        self.server.close()
+        await self.server.wait_closed()
+        self._refillTask.cancel()
+        for task in list(self._refillTasks):
+            task.cancel()
+        self.pool.shutdown(cancel_futures=True)
+
+    async def _generate (self, params):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, _generatePacked, params)
+
+    async def _refillLoop (self):
+        """
+            Tops the warm pools up whenever a worker isn't busy with requests.
+        """
+        while True:
+            await self._refillWanted.wait()
+            self._refillWanted.clear()
+            for key, (params, poolSize, entries) in self.warmPools.items():
+                while key not in self.failedPools and len(entries) + self._refillCounts[key] < poolSize and \
+                        self.jobsInFlight + self.refillsInFlight < self.workers:
+                    self._refillCounts[key] += 1
+                    self.refillsInFlight += 1
+                    task = asyncio.ensure_future(self._refill(key, params,
+                                                              entries))
+                    self._refillTasks.add(task)
+                    task.add_done_callback(self._refillTasks.discard)
+
+    async def _refill (self, key, params, entries):
+        try:
+            params = dict(params, seed=random.getrandbits(63))
+            data = await self._generate(params)
+            entries.append((params["seed"], data))
+            self.counters["refilled"] += 1
+        except Exception:
+            # Retrying would fail the same way, over and over:
+            self.counters["errors"] += 1
+            self.failedPools.add(key)
+        finally:
+            self._refillCounts[key] -= 1
+            self.refillsInFlight -= 1
+            self._refillWanted.set()
+
+    async def handleRequest (self, request):
+        """
+            Answers one decoded request. Returns (header dict, payload bytes).
+        """
+        if request.get("metrics"):
+            return self.metrics(), b""
+        startTime = time.perf_counter()
+        self.counters["requests"] += 1
+        params = _normalizeParams(request)
+        pooled = False
+        warmPool = self.warmPools.get(_poolKey(params))
+        if "seed" not in params and warmPool != None and warmPool[2]:
+            seed, data = warmPool[2].popleft()
+            pooled = True
+            self.counters["pooled"] += 1
+            self._refillWanted.set()
+        else:
+            if "seed" not in params:
+                params["seed"] = random.getrandbits(63)
+            seed = params["seed"]
+            self.jobsInFlight += 1
+            try:
+                data = await self._generate(params)
+            finally:
+                self.jobsInFlight -= 1
+                self._refillWanted.set()
+            self.counters["generated"] += 1
+        seconds = time.perf_counter() - startTime
+        self.latencies.append(seconds)
+        return ({"dungeonSize": list(params["dungeonSize"]), "seed": seed,
+                 "pooled": pooled, "seconds": seconds, "length": len(data)},
+                data)
+
+    async def _handleClient (self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Requests must be JSON objects")
+                    header, data = await self.handleRequest(request)
+                except (ValueError, TypeError) as error:
+                    self.counters["errors"] += 1
+                    header, data = {"error": str(error)}, b""
+                writer.write(json.dumps(header).encode() + b"\n" + data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def metrics (self):
+        """
+            Returns the queue depth, pool sizes, counters and request latency
+             percentiles (seconds, over the last latencyWindow requests).
+        """
+        latencies = sorted(self.latencies)
+        latency = {"count": len(latencies)}
+        if latencies:
+            latency["mean"] = sum(latencies) / len(latencies)
+            for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                latency[name] = latencies[min(int(fraction * len(latencies)),
+                                              len(latencies) - 1)]
+        return {"queueDepth": self.jobsInFlight,
+                "refillsInFlight": self.refillsInFlight,
+                "workers": self.workers,
+                "pools": dict((key, len(entries)) for key, (params, poolSize,
+                              entries) in self.warmPools.items()),
+                "failedPools": sorted(self.failedPools),
+                "counters": dict(self.counters), "latency": latency}
+
+def _parseAddress (address):
+    """
+        Returns ("tcp", (host, port)) for "host:port" and ("unix", path) for
+         anything else.
+    """
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return "tcp", (host or "127.0.0.1", int(port))
+    return "unix", address
+
+def _responseDungeon (header, data):
+    if "error" in header:
+        raise ValueError(header["error"])
+    return header, pybsp.PackedDungeon(tuple(header["dungeonSize"]),
+                                       bytearray(data))
+
+class DungeonClient ():
+    """
+        A blocking client for DungeonService.
+        address is "host:port" or a Unix socket path.
+    """
+    def __init__ (self, address="127.0.0.1:8765"):
+        import socket
+        kind, target = _parseAddress(address)
+        family = socket.AF_INET if kind == "tcp" else socket.AF_UNIX
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.connect(target)
+        self.file = self.socket.makefile("rb")
+
+    def _request (self, request):
+        self.socket.sendall(json.dumps(request).encode() + b"\n")
+        header = json.loads(self.file.readline())
+        return header, self.file.read(header.get("length", 0))
+
+    def generate (self, dungeonSize=(100, 100), minNodeSize=(20, 20), **params):
+        """
+            Requests one dungeon. Returns (header, PackedDungeon), where header
+             holds the seed used and whether it came from a warm pool.
+        """
+        return _responseDungeon(*self._request(dict(params,
+                                                     dungeonSize=dungeonSize,
+                                                     minNodeSize=minNodeSize)))
+
+    def metrics (self):
+        return self._request({"metrics": True})[0]
+
+    def close (self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, *excInfo):
+        self.close()
+
+class AsyncDungeonClient ():
+    """
+        The asyncio version of DungeonClient. Create it with
+         await AsyncDungeonClient.connect(address).
+    """
+    def __init__ (self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect (cls, address="127.0.0.1:8765"):
+        kind, target = _parseAddress(address)
+        if kind == "tcp":
+            reader, writer = await asyncio.open_connection(*target)
+        else:
+            reader, writer = await asyncio.open_unix_connection(target)
+        return cls(reader, writer)
+
+    async def _request (self, request):
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+        header = json.loads(await self.reader.readline())
+        return header, await self.reader.readexactly(header.get("length", 0))
+
+    async def generate (self, dungeonSize=(100, 100), minNodeSize=(20, 20),
+                        **params):
+        return _responseDungeon(*await self._request(
+            dict(params, dungeonSize=dungeonSize, minNodeSize=minNodeSize)))
+
+    async def metrics (self):
+        return (await self._request({"metrics": True}))[0]
+
+    async def close (self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+def _parseWarmSpec (spec):
+    """
+        Parses "WxH/MxN:count" into ({"dungeonSize": ..., "minNodeSize": ...},
+         count).
+    """
+    sizes, separator, count = spec.partition(":")
+    dungeonSize, separator, minNodeSize = sizes.partition("/")
+    return ({"dungeonSize": [int(v) for v in dungeonSize.split("x")],
+             "minNodeSize": [int(v) for v in (minNodeSize or "20x20").split("x")]},
+            int(count or 16))
+
+async def _serve (args):
+    service = DungeonService(args.workers,
+                             [_parseWarmSpec(spec) for spec in args.warm])
+    if args.unix:
+        await service.start(unixPath=args.unix)
+    else:
+        await service.start(tcp=_parseAddress(args.tcp)[1])
+    print("Serving on %s" % (args.unix or args.tcp))
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.close()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve dungeon generation requests')
+    parser.add_argument('--tcp', default="127.0.0.1:8765",
+                        help='host:port to listen on.')
+    parser.add_argument('--unix', default=None,
+                        help='Unix socket path to listen on instead of --tcp.')
+    parser.add_argument('--workers', default=None, type=int,
+                        help='Generation processes, the CPU count by default.')
+    parser.add_argument('--warm', default=[], nargs='*',
+                        help='Parameter sets to pre-generate, as WxH/MxN:count.')
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+    except ValueError as error:
+        parser.exit(2, "%s: error: %s\n" % (parser.prog, error))